@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Measure the memory saved by --compact on a stored snapshot
+
+Each snapshot (a files dir or a pack file, as written by vicloud) is read
+back, and the items of each datatype/profile/region are turned back into a
+json decoded page, like the reply they were fetched from.  The memory held
+by all the pages is then measured as they are, and after passing every
+item through the same compact() used while fetching (with one table for
+each datatype, as each handler has its own).  Without any snapshots, a
+made up set of network interfaces is used instead.
+"""
+#
+#
+
+import argparse
+import collections
+import json
+import os
+import sys
+import tracemalloc
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
+)
+
+import aws                  # noqa
+import snapshot             # noqa
+
+
+def made_up_items(count, regions):
+    """Yield stored items, shaped like the ec2 network_interfaces"""
+    for n in range(count):
+        region = f"region-{n % regions}"
+        vpc = f"vpc-{n % 20:017x}"
+        subnet = f"subnet-{n % 200:017x}"
+        yield {
+            "datatype": "aws.ec2.network_interfaces",
+            "metadata": {
+                "profile": "bench",
+                "region": region,
+                "resourceid": f"eni-{n:017x}",
+            },
+            "specifics": {
+                "AvailabilityZone": f"{region}{'abc'[n % 3]}",
+                "Description": "",
+                "Groups": [{
+                    "GroupId": f"sg-{n % 50:017x}",
+                    "GroupName": f"group-{n % 50}",
+                }],
+                "InterfaceType": "interface",
+                "MacAddress": f"02:00:00:{n >> 16 & 255:02x}"
+                              f":{n >> 8 & 255:02x}:{n & 255:02x}",
+                "NetworkInterfaceId": f"eni-{n:017x}",
+                "OwnerId": "123456789012",
+                "PrivateIpAddress": f"10.{n >> 16 & 255}.{n >> 8 & 255}"
+                                    f".{n & 255}",
+                "RequesterManaged": False,
+                "SourceDestCheck": True,
+                "Status": "in-use",
+                "SubnetId": subnet,
+                "TagSet": [
+                    {"Key": "Name", "Value": f"web-{n % 100}"},
+                    {"Key": "Environment", "Value": "production"},
+                ],
+                "VpcId": vpc,
+            },
+        }
+
+
+def load_pages(items):
+    """Return the specifics of the items, grouped into json decoded pages
+    for each datatype/profile/region"""
+    groups = collections.defaultdict(list)
+    for item in items:
+        metadata = item["metadata"]
+        key = (item["datatype"], metadata["profile"], metadata["region"])
+        groups[key].append(item["specifics"])
+
+    # Encode them all first, so that only the decoded pages are measured
+    raw = {key: json.dumps(group) for key, group in groups.items()}
+    del groups
+
+    return {key: json.loads(page) for key, page in raw.items()}
+
+
+def argparser():
+    args = argparse.ArgumentParser(
+        description=__doc__,
+    )
+
+    args.add_argument(
+        "--items",
+        type=int,
+        default=100000,
+        help="How many items to make up, if no snapshot is given",
+    )
+    args.add_argument(
+        "--regions",
+        type=int,
+        default=5,
+        help="How many regions to spread the made up items over",
+    )
+    args.add_argument(
+        "snapshot",
+        nargs="*",
+        help="Stored snapshots (files dirs or pack files)",
+    )
+
+    r = args.parse_args()
+    return r
+
+
+def main():
+    args = argparser()
+
+    if args.snapshot:
+        items = []
+        for pathname in args.snapshot:
+            items.extend(snapshot.load(pathname))
+    else:
+        items = list(made_up_items(args.items, args.regions))
+    count = len(items)
+
+    # Trace from before the pages are loaded, as the compacted copy still
+    # uses the first copy of each string from them
+    tracemalloc.start()
+    pages = load_pages(items)
+    del items
+    plain_size, _ = tracemalloc.get_traced_memory()
+
+    tables = collections.defaultdict(dict)
+    compacted = {}
+    for key in list(pages):
+        table = tables[key[0]]
+        compacted[key] = [aws.compact(item, table) for item in pages.pop(key)]
+    del tables
+    compact_size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{count} items:"
+        f" plain {plain_size / 1e6:.1f}MB,"
+        f" compact {compact_size / 1e6:.1f}MB"
+        f" ({100 * (1 - compact_size / plain_size):.0f}% less)"
+    )
+
+
+if __name__ == "__main__":
+    main()
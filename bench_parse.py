@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Compare the speed of the fast json parser with the standard botocore one
+
+Each response file should hold the raw json body of a response to the
+given operation (the output of the aws cli, with --output json, is close
+enough).  Without any files, a response is made up from the output shape
+of the operation.
+"""
+#
+#
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
+)
+
+import botocore.parsers     # noqa
+import botocore.session     # noqa
+import fastparse            # noqa
+
+
+def make_value(shape, items, depth=0):
+    """Return a made up json value matching the shape.  The first list found
+    gets the given number of items, any others just get two"""
+    kind = shape.type_name
+
+    if kind == "structure":
+        if depth > 6:
+            return {}
+        value = {}
+        for name, member in shape.members.items():
+            wire_name = member.serialization.get("name", name)
+            value[wire_name] = make_value(member, items, depth + 1)
+            if member.type_name == "list":
+                items = 2
+        return value
+    if kind == "list":
+        if depth > 6:
+            return []
+        return [make_value(shape.member, 2, depth + 1) for _ in range(items)]
+    if kind == "map":
+        return {"key": make_value(shape.value, 2, depth + 1)}
+    if kind == "timestamp":
+        return 1700000000.123
+    if kind == "blob":
+        return base64.b64encode(b"blob").decode("utf8")
+    if kind == "boolean":
+        return True
+    if kind in ("integer", "long"):
+        return 12345
+    if kind in ("float", "double"):
+        return 1.5
+    return "value-" + shape.name
+
+
+def time_parse(parser, raw, shape, repeat):
+    """Return the best time taken to parse the raw body, and the result"""
+    best = None
+    for _ in range(repeat):
+        response = {
+            "body": raw,
+            "headers": {"x-amzn-requestid": "bench"},
+            "status_code": 200,
+        }
+        start = time.perf_counter()
+        result = parser.parse(response, shape)
+        taken = time.perf_counter() - start
+        if best is None or taken < best:
+            best = taken
+    return best, result
+
+
+def argparser():
+    args = argparse.ArgumentParser(
+        description=__doc__,
+    )
+
+    args.add_argument(
+        "--service",
+        default="logs",
+        help="The service name",
+    )
+    args.add_argument(
+        "--operation",
+        default="DescribeLogStreams",
+        help="The operation name, as used in the API",
+    )
+    args.add_argument(
+        "--items",
+        type=int,
+        default=5000,
+        help="How many items to put in a made up response",
+    )
+    args.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="How many times to parse each response, keeping the best",
+    )
+    args.add_argument(
+        "filename",
+        nargs="*",
+        help="Recorded response bodies",
+    )
+
+    r = args.parse_args()
+    return r
+
+
+def main():
+    args = argparser()
+
+    session = botocore.session.get_session()
+    model = session.get_service_model(args.service)
+    protocol = model.metadata["protocol"]
+    shape = model.operation_model(args.operation).output_shape
+
+    responses = {}
+    for filename in args.filename:
+        with open(filename, "rb") as f:
+            responses[filename] = f.read()
+    if not responses:
+        made_up = make_value(shape, args.items)
+        responses["(made up)"] = json.dumps(made_up).encode("utf8")
+
+    standard = botocore.parsers.create_parser(protocol)
+    fast = fastparse.ResponseParserFactory().create_parser(
+        protocol,
+        (model.service_name, model.api_version),
+    )
+
+    for name, raw in responses.items():
+        standard_time, standard_result = time_parse(
+            standard,
+            raw,
+            shape,
+            args.repeat,
+        )
+        fast_time, fast_result = time_parse(fast, raw, shape, args.repeat)
+
+        same = "same" if fast_result == standard_result else "DIFFERENT"
+        print(
+            f"{name}: {len(raw)} bytes,"
+            f" standard {standard_time * 1000:.1f}ms,"
+            f" fast {fast_time * 1000:.1f}ms,"
+            f" {standard_time / fast_time:.1f}x, results {same}"
+        )
+
+
+if __name__ == "__main__":
+    main()
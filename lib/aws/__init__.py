@@ -1,17 +1,569 @@
 import boto3
 import botocore
+import botocore.config
+import botocore.credentials
+import botocore.session
+import collections
+import contextlib
+import copy
+import concurrent.futures
 import definitionset
+import fastparse
+import heapq
+import jmespath
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
 import sys
+import threading
+import time
 import vicloud
 
 
+# How many accounts to set up at once in setup_org_sessions
+ORG_WORKERS = 16
+
+# How long to remember which account a profile uses
+ACCOUNT_CACHE_TTL = 24 * 60 * 60
+
+# The credential providers that can use a cache
+CACHED_PROVIDERS = [
+    "assume-role",
+    "assume-role-with-web-identity",
+    "sso",
+]
+
+# The transport settings for every client, unless overridden
+TRANSPORT_DEFAULTS = {
+    "connect_timeout": 10,
+    "read_timeout": 60,
+    "tcp_keepalive": True,
+    "retry_mode": "standard",
+    "max_attempts": 5,
+}
+
+_transport = {
+    "default": dict(TRANSPORT_DEFAULTS),
+    "services": {},
+}
+_client_configs = {}
+
+# How long to remember that a region or operation fails
+NEGATIVE_CACHE_TTL = 24 * 60 * 60
+
+# The error codes that mean the whole region cannot be used
+REGION_SKIP_CODES = [
+    "AuthFailure",
+    "InvalidClientTokenId",
+]
+
+# The error codes that mean just this operation cannot be used
+OPERATION_SKIP_CODES = [
+    "UnsupportedOperation",
+]
+
+_negative = {
+    "ttl": 0,
+    "accounts": {},
+    "known": {},
+    "avoided": 0,
+    # Whether the credentials for each profile worked, checked in this run
+    "credentials": {},
+}
+_negative_lock = threading.Lock()
+
+# How many recent call latencies to keep for each operation, and how many
+# are needed before they are used to decide when to hedge
+LATENCY_SAMPLES = 100
+LATENCY_MIN_SAMPLES = 20
+
+_deadlines = {
+    "deadline": None,
+    "attempts": 3,
+    "hedge_percentile": None,
+    "budget": None,
+}
+_latencies = collections.defaultdict(
+    lambda: collections.deque(maxlen=LATENCY_SAMPLES),
+)
+
+# How many pages to fetch ahead of the one being processed
+PREFETCH_PAGES = 1
+
+_prefetch = {
+    "pages": PREFETCH_PAGES,
+}
+
+_parsing = {
+    "fast": False,
+}
+_fast_parser_factory = fastparse.ResponseParserFactory()
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_client_lock = threading.Lock()
+
+# The results of parent handlers, shared with their children, see
+# base._parent_data()
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def setup_transport(settings=None, services=None, concurrency=1):
+    """Set the transport settings used by every client.
+
+    settings overrides TRANSPORT_DEFAULTS (any None value is ignored) and
+    services maps a service name to its own overrides.  Unless set, the
+    connection pool is sized to suit the given concurrency"""
+    default = dict(TRANSPORT_DEFAULTS)
+    default["max_pool_connections"] = max(10, concurrency)
+    if settings:
+        default.update({k: v for k, v in settings.items() if v is not None})
+
+    _transport["default"] = default
+    _transport["services"] = services or {}
+    _client_configs.clear()
+
+
+def client_config(service_name=None):
+    """Return the botocore Config for clients of the service"""
+    config = _client_configs.get(service_name)
+    if config is not None:
+        return config
+
+    settings = dict(_transport["default"])
+    if service_name is not None:
+        settings.update(_transport["services"].get(service_name, {}))
+
+    retries = {
+        "mode": settings.pop("retry_mode"),
+        "total_max_attempts": settings.pop("max_attempts"),
+    }
+    config = botocore.config.Config(retries=retries, **settings)
+    _client_configs[service_name] = config
+    return config
+
+
+def credential_cache():
+    """Return the on-disk cache of temporary credentials"""
+    return botocore.credentials.JSONFileCache(
+        vicloud.cache_filename("credentials"),
+    )
+
+
+def setup_negative_cache(ttl=NEGATIVE_CACHE_TTL):
+    """Remember, for ttl seconds, the regions and operations that fail, so
+    that later runs can skip them (a ttl of zero disables this)"""
+    _negative["ttl"] = ttl
+    _negative["avoided"] = 0
+    _negative["credentials"] = {}
+    if not ttl:
+        _negative["known"] = {}
+        return
+
+    _negative["accounts"] = vicloud.cache_load(
+        "accounts.json",
+        ACCOUNT_CACHE_TTL,
+    )
+    _negative["known"] = vicloud.cache_load("negative.json", ttl)
+
+
+def _negative_key(profile, region, service, operation):
+    # Key on the account, if known, as several profiles can share it
+    account = _negative["accounts"].get(profile, {}).get("account", profile)
+    return f"{account}:{region}:{service}:{operation}"
+
+
+def negative_known(profile, region, service="*", operation="*"):
+    """Is this region (or operation) known to fail?  Counts each time a
+    call is avoided because of it"""
+    if not _negative["known"]:
+        return False
+    key = _negative_key(profile, region, service, operation)
+    if key not in _negative["known"]:
+        return False
+    _negative["avoided"] += 1
+    return True
+
+
+def negative_record(profile, region, service="*", operation="*"):
+    """Remember that this region (or operation) fails"""
+    if not _negative["ttl"]:
+        return
+
+    key = _negative_key(profile, region, service, operation)
+    entry = {
+        "time": time.time(),
+    }
+    _negative["known"][key] = entry
+
+    # Other processes might be saving their own entries
+    with vicloud.cache_lock("negative.json"):
+        known = vicloud.cache_load("negative.json", _negative["ttl"])
+        known[key] = entry
+        vicloud.cache_save("negative.json", known)
+
+
+def negative_credentials_work(profile, session):
+    """Can the credentials of this session be used at all?  The errors for
+    a region that cannot be used are also given for bad credentials, so a
+    region is only remembered once this is confirmed.  Checked once for each
+    profile in a run"""
+    with _negative_lock:
+        if profile not in _negative["credentials"]:
+            try:
+                with _client_lock:
+                    client = session.client(
+                        "sts",
+                        config=client_config("sts"),
+                    )
+                client.get_caller_identity()
+                works = True
+            except (
+                    botocore.exceptions.BotoCoreError,
+                    botocore.exceptions.ClientError,
+            ):
+                works = False
+            _negative["credentials"][profile] = works
+        return _negative["credentials"][profile]
+
+
+def negative_avoided():
+    """Return how many calls were avoided by the negative cache"""
+    return _negative["avoided"]
+
+
+def setup_deadlines(deadline=None, attempts=3, hedge_percentile=None,
+                    budget=None):
+    """Limit how long fetching can take.
+
+    Each call is given deadline seconds (None for no limit) and is tried up
+    to attempts times.  With a hedge_percentile, a duplicate call is also
+    made once a call is slower than that percentile of the recent calls to
+    the same operation, and whichever finishes first is used.  Each handler
+    stops fetching any more regions after budget seconds"""
+    _deadlines["deadline"] = deadline
+    _deadlines["attempts"] = attempts
+    _deadlines["hedge_percentile"] = hedge_percentile
+    _deadlines["budget"] = budget
+
+
+def _hedge_delay(key):
+    """Return how long to wait before hedging a call, or None"""
+    percentile = _deadlines["hedge_percentile"]
+    samples = _latencies[key]
+    if percentile is None or len(samples) < LATENCY_MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+    return ordered[index]
+
+
+def _start_call(method, kwargs):
+    """Start the call in its own thread, returning a Future for its result.
+    A daemon thread is used so that an abandoned call cannot hold up the
+    exit"""
+    future = concurrent.futures.Future()
+
+    def run():
+        try:
+            future.set_result(method(**kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def _deadlines_active():
+    """Is any call given a deadline, or hedged?"""
+    if _deadlines["deadline"] is not None:
+        return True
+    return _deadlines["hedge_percentile"] is not None
+
+
+def deadline_method(client, operation):
+    """Return the client method for the operation, wrapped to apply any
+    deadline, retries and hedging"""
+    method = getattr(client, operation)
+    if not _deadlines_active():
+        return method
+
+    region = client.meta.region_name
+    key = (client.meta.service_model.service_name, operation)
+
+    def call(**kwargs):
+        deadline = _deadlines["deadline"]
+        for attempt in range(_deadlines["attempts"]):
+            start = time.monotonic()
+            futures = [_start_call(method, kwargs)]
+
+            hedge = _hedge_delay(key)
+            if hedge is not None and (deadline is None or hedge < deadline):
+                done, _ = concurrent.futures.wait(futures, timeout=hedge)
+                if not done:
+                    futures.append(_start_call(method, kwargs))
+
+            # Use the first call to succeed.  If one fails while another
+            # is still running, wait for that one instead
+            pending = set(futures)
+            error = None
+            while pending:
+                timeout = None
+                if deadline is not None:
+                    timeout = max(0, deadline - (time.monotonic() - start))
+                done, pending = concurrent.futures.wait(
+                    pending,
+                    timeout=timeout,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                if not done:
+                    break
+                for future in done:
+                    if future.exception() is None:
+                        _latencies[key].append(time.monotonic() - start)
+                        return future.result()
+                    if error is None:
+                        error = future.exception()
+
+            if not pending:
+                raise error
+
+            # TODO: use a common logger (see base.log())
+            print(
+                f"{region}:{key[0]} {operation} deadline exceeded"
+                f" (attempt {attempt + 1})",
+                file=sys.stderr,
+            )
+
+        raise TimeoutError(
+            f"{region}:{key[0]} {operation} deadline exceeded"
+        )
+
+    return call
+
+
+_paginator_models = {}
+_paginator_models_lock = threading.Lock()
+
+
+def _pagination_config(client, operation):
+    """Return the botocore pagination config for the operation"""
+    service_model = client.meta.service_model
+    key = (service_model.service_name, service_model.api_version)
+    with _paginator_models_lock:
+        model = _paginator_models.get(key)
+        if model is None:
+            model = botocore.session.get_session().get_paginator_model(*key)
+            _paginator_models[key] = model
+    return model.get_paginator(client.meta.method_to_api_mapping[operation])
+
+
+def _as_list(value):
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def paginate(client, operation, page_size=None, **kwargs):
+    """Yield each page of the operation.  Normally the botocore paginator is
+    used, but with deadlines or hedging the pages are requested here
+    (following the same pagination config), so that every call goes through
+    deadline_method()"""
+    operator = deadline_method(client, operation)
+
+    if not client.can_paginate(operation):
+        yield operator(**kwargs)
+        return
+
+    if not _deadlines_active():
+        paginator = client.get_paginator(operation)
+        config = {}
+        if page_size is not None:
+            config["PageSize"] = page_size
+        yield from paginator.paginate(PaginationConfig=config, **kwargs)
+        return
+
+    config = _pagination_config(client, operation)
+    input_tokens = _as_list(config["input_token"])
+    output_tokens = [
+        jmespath.compile(token) for token in _as_list(config["output_token"])
+    ]
+    more_results = config.get("more_results")
+    if more_results is not None:
+        more_results = jmespath.compile(more_results)
+
+    limit_key = config.get("limit_key")
+    if page_size is not None and limit_key is not None:
+        api_name = client.meta.method_to_api_mapping[operation]
+        input_shape = client.meta.service_model.operation_model(
+            api_name,
+        ).input_shape
+        if input_shape.members[limit_key].type_name == "string":
+            page_size = str(page_size)
+        kwargs[limit_key] = page_size
+
+    previous = None
+    while True:
+        page = operator(**kwargs)
+        yield page
+
+        if more_results is not None and not more_results.search(page):
+            return
+
+        tokens = [token.search(page) for token in output_tokens]
+        if all(token is None for token in tokens):
+            return
+        if tokens == previous:
+            raise botocore.exceptions.PaginationError(
+                message=f"The same next token was received twice: {tokens}"
+            )
+        previous = tokens
+
+        for name, token in zip(input_tokens, tokens):
+            if token is None:
+                kwargs.pop(name, None)
+            else:
+                kwargs[name] = token
+
+
+def setup_fast_parse(enabled=True):
+    """Use the fast parsers (see fastparse) for the json protocol services,
+    in every session set up after this"""
+    _parsing["fast"] = enabled
+
+
+def _setup_parser(botocore_session):
+    if _parsing["fast"]:
+        botocore_session.register_component(
+            "response_parser_factory",
+            _fast_parser_factory,
+        )
+        # Lets the parsers share their converters for each service
+        botocore_session.register("before-parse", fastparse.before_parse)
+
+
+def setup_prefetch(pages=PREFETCH_PAGES):
+    """Set how many pages to fetch ahead (zero to disable prefetching)"""
+    _prefetch["pages"] = pages
+
+
+def merge_pages(iterators, workers, maxsize):
+    """Yield the pages from all the iterators, run by up to the given number
+    of background threads, with at most maxsize pages waiting to be read.
+    The pages from each iterator stay in order, but may be interleaved with
+    the pages from the others"""
+    pending = queue.SimpleQueue()
+    count = 0
+    for pages in iterators:
+        pending.put(pages)
+        count += 1
+    workers = max(1, min(workers, count))
+
+    q = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(entry):
+        # Give up if the reader has gone away
+        while not stop.is_set():
+            try:
+                q.put(entry, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        try:
+            while not stop.is_set():
+                try:
+                    pages = pending.get_nowait()
+                except queue.Empty:
+                    break
+                for page in pages:
+                    if not put((True, page)):
+                        return
+        except BaseException as e:
+            put((False, e))
+            return
+        put((False, None))
+
+    for _ in range(workers):
+        threading.Thread(target=run, daemon=True).start()
+
+    try:
+        while workers:
+            ok, page = q.get()
+            if not ok:
+                if page is not None:
+                    raise page
+                workers -= 1
+                continue
+            yield page
+    finally:
+        stop.set()
+
+
+def prefetch(pages):
+    """Yield from the pages iterator, while a background thread fetches up
+    to the configured number of pages ahead"""
+    lookahead = _prefetch["pages"]
+    if not lookahead:
+        yield from pages
+        return
+
+    yield from merge_pages([pages], 1, lookahead)
+
+
+def get_session(profile=None):
+    """Return the shared session for this profile.
+
+    The temporary credentials from any assumed role or SSO login are cached
+    on disk, so they are shared with other processes and later runs until
+    they expire"""
+    with _sessions_lock:
+        if profile in _sessions:
+            return _sessions[profile]
+
+        botocore_session = botocore.session.Session(profile=profile)
+        botocore_session.set_default_client_config(client_config())
+        _setup_parser(botocore_session)
+        cache = credential_cache()
+        resolver = botocore_session.get_component("credential_provider")
+        for name in CACHED_PROVIDERS:
+            provider = resolver.get_provider(name)
+            if provider is not None:
+                provider.cache = cache
+
+        session = boto3.Session(botocore_session=botocore_session)
+        _sessions[profile] = session
+
+    # Fetch the credentials now, holding a lock so that if several processes
+    # start at once, only one of them makes the STS call and the others
+    # find its result in the cache
+    with _credentials_lock(session):
+        try:
+            credentials = session.get_credentials()
+            if credentials is not None:
+                credentials.get_frozen_credentials()
+        except (
+                botocore.exceptions.BotoCoreError,
+                botocore.exceptions.ClientError,
+        ):
+            # Leave any error to be reported by the first real call
+            pass
+
+    return session
+
+
 class DataSource(vicloud.DataSource):
-    def __init__(self, profile, region):
+    def __init__(self, profile, region, session=None):
         self.datatype_prefix = "aws."
         self.profile = profile
         self.region = region
         self.single_region = False
-        self._session = None
+        self._session = session
 
     def metadata(self):
         meta = {
@@ -25,7 +577,7 @@ class DataSource(vicloud.DataSource):
     @property
     def session(self):
         if self._session is None:
-            self._session = boto3.Session(profile_name=self.profile)
+            self._session = get_session(self.profile)
         return self._session
 
     def client(self, service_name):
@@ -36,68 +588,171 @@ class DataSource(vicloud.DataSource):
             region = "ap-southeast-2"
             self.single_region = True
 
-        return self.session.client(
-            service_name,
-            region_name=region,
-        )
+        # Creating clients from one session is not thread safe
+        with _client_lock:
+            return self.session.client(
+                service_name,
+                region_name=region,
+                config=client_config(service_name),
+            )
 
     def operation(self, service_name, operation, **kwargs):
         """Wrap possible pagination in a helper"""
         client = self.client(service_name)
+        # The PageSize can be given in the same way as for a botocore
+        # paginator
+        config = kwargs.pop("PaginationConfig", {})
+        pages = paginate(
+            client,
+            operation,
+            config.get("PageSize", 50),
+            **kwargs,
+        )
 
-        if not client.can_paginate(operation):
-            operator = getattr(client, operation)
-            yield operator(**kwargs)
-        else:
-            token = None
-            paginator = client.get_paginator(operation)
+        # Fetch the next page while this one is being processed
+        for page in prefetch(pages):
+            # TODO
+            # if not quiet and enough tags since last print
+            #   print stderr fetching ...
+            yield page
+
+
+def _error_code(e):
+    """Return a short name for a botocore error"""
+    if isinstance(e, botocore.exceptions.ClientError):
+        return e.response["Error"]["Code"]
+    return type(e).__name__
+
+
+def _session_regions(verbose, name, session, regions, client_lock=None):
+    """Return the regions to use for this session.  If the session is shared
+    with other threads, client_lock is held while creating the client"""
+    if regions:
+        return regions
+
+    # Get the list of regions enabled for our profile
+    with client_lock or contextlib.nullcontext():
+        client = session.client(
+            "ec2",
+            region_name="ap-southeast-2",
+            config=client_config("ec2"),
+        )
+
+    # TODO: use a common logger (see base.log())
+    if verbose:
+        print(f"{name}: describe_regions", file=sys.stderr)
+
+    try:
+        reply = client.describe_regions()
+        return [r['RegionName'] for r in reply['Regions']]
+    except (
+            botocore.exceptions.BotoCoreError,
+            botocore.exceptions.ClientError,
+    ) as e:
+        code = _error_code(e)
+        # TODO: use a common logger (see base.log())
+        print(f"{name}: ERROR: {code}, skipping", file=sys.stderr)
+        return []
+
+
+def _principal(arn):
+    """Return the principal from a caller identity arn.  An assumed role
+    arn also names the role session, which changes on every login, so only
+    the role is kept"""
+    parts = arn.split(":", 5)
+    if len(parts) == 6 and parts[5].startswith("assumed-role/"):
+        role = parts[5].split("/")[1]
+        return f"{':'.join(parts[:5])}:assumed-role/{role}"
+    return arn
+
+
+def _profile_identity(profile):
+    """Return the account id and principal that this profile uses, or
+    None"""
+    session = get_session(profile)
+    try:
+        client = session.client("sts", config=client_config("sts"))
+        reply = client.get_caller_identity()
+        return reply["Account"], _principal(reply["Arn"])
+    except (
+            botocore.exceptions.BotoCoreError,
+            botocore.exceptions.ClientError,
+    ):
+        return None
+
+
+def dedupe_profiles(verbose, profiles):
+    """Return the profiles with only the first one for each account and
+    principal (user or role).  Profiles using different roles in one account
+    can see different resources, so they are all kept"""
+    cache = vicloud.cache_load("accounts.json", ACCOUNT_CACHE_TTL)
+
+    # Entries from before the principal was recorded are looked up again
+    unknown = [p for p in profiles if "principal" not in cache.get(p, {})]
+    if unknown:
+        # TODO: use a common logger (see base.log())
+        if verbose:
+            print(
+                f"get_caller_identity for {len(unknown)} profiles",
+                file=sys.stderr,
+            )
 
-            param = {
-                "PaginationConfig": {
-                    "PageSize": 50,
-                    "StartingToken": token,
+        with concurrent.futures.ThreadPoolExecutor(ORG_WORKERS) as executor:
+            results = executor.map(_profile_identity, unknown)
+
+            for profile, identity in zip(unknown, results):
+                if identity is None:
+                    # Do not cache failures, they might just need a login
+                    cache.pop(profile, None)
+                    continue
+                account, principal = identity
+                cache[profile] = {
+                    "account": account,
+                    "principal": principal,
+                    "time": time.time(),
                 }
-            }
-            param.update(kwargs)
 
-            response = paginator.paginate(**param)
+        vicloud.cache_save("accounts.json", cache)
 
-            for page in response:
-                # TODO
-                # if not quiet and enough tags since last print
-                #   print stderr fetching ...
-                yield page
+    result = []
+    seen = {}
+    for profile in profiles:
+        if profile not in cache:
+            # If we cannot tell the account, keep the profile
+            result.append(profile)
+            continue
+
+        identity = (cache[profile]["account"], cache[profile]["principal"])
+        if identity in seen:
+            # TODO: use a common logger (see base.log())
+            if verbose:
+                print(
+                    f"{profile}: same account and principal as"
+                    f" {seen[identity]}, skipping",
+                    file=sys.stderr,
+                )
+            continue
 
+        seen[identity] = profile
+        result.append(profile)
 
-def setup_sessions(verbose, profiles, regions):
+    return result
+
+
+def setup_sessions(verbose, profiles, regions, dedupe=False):
     sessions = []
 
     if not profiles:
         session = boto3.Session()
         profiles = session.available_profiles
 
-    for profile in profiles:
-        session = boto3.Session(profile_name=profile)
-
-        if not regions:
-            # Get the list of regions enabled for our profile
-            client = session.client("ec2", region_name="ap-southeast-2")
-
-            # TODO: use a common logger (see base.log())
-            if verbose:
-                print(f"{profile}: describe_regions", file=sys.stderr)
+    if dedupe:
+        profiles = dedupe_profiles(verbose, profiles)
 
-            try:
-                reply = client.describe_regions()
-                this_regions = [r['RegionName'] for r in reply['Regions']]
-            except botocore.exceptions.ClientError as e:
-                code = e.response["Error"]["Code"]
-                # TODO: use a common logger (see base.log())
-                print(f"{profile}: ERROR: {code}, skipping", file=sys.stderr)
-                this_regions = []
+    for profile in profiles:
+        session = get_session(profile)
 
-        else:
-            this_regions = regions
+        this_regions = _session_regions(verbose, profile, session, regions)
 
         for region in this_regions:
             this = {
@@ -111,13 +766,761 @@ def setup_sessions(verbose, profiles, regions):
     return sessions
 
 
+class _AssumeRoleProvider(botocore.credentials.CredentialProvider):
+    """Provide the credentials for a role assumed from another session"""
+    METHOD = "assume-role"
+    CANONICAL_NAME = "custom-vicloud-assume-role"
+
+    def __init__(self, fetcher):
+        super().__init__()
+        self._fetcher = fetcher
+
+    def load(self):
+        return botocore.credentials.DeferredRefreshableCredentials(
+            refresh_using=self._fetcher.fetch_credentials,
+            method=self.METHOD,
+        )
+
+
+def _assume_role_session(source, role_arn, client_lock):
+    """Return a session using the role, with credentials that are cached on
+    disk and refreshed when they expire"""
+
+    def client_creator(*args, **kwargs):
+        # Creating clients from one session is not thread safe
+        with client_lock:
+            return source.client(*args, **kwargs)
+
+    fetcher = botocore.credentials.AssumeRoleCredentialFetcher(
+        client_creator=client_creator,
+        source_credentials=source.get_credentials(),
+        role_arn=role_arn,
+        extra_args={"RoleSessionName": "vicloud"},
+        cache=credential_cache(),
+    )
+
+    # Only the role is used, never any credentials from the environment
+    botocore_session = botocore.session.Session()
+    botocore_session.set_default_client_config(client_config())
+    _setup_parser(botocore_session)
+    botocore_session.register_component(
+        "credential_provider",
+        botocore.credentials.CredentialResolver(
+            [_AssumeRoleProvider(fetcher)],
+        ),
+    )
+    return boto3.Session(botocore_session=botocore_session)
+
+
+def _credentials_lock(session, role_arn=None):
+    """Return a lock, shared with any other processes, to hold while fetching
+    the credentials of the session (or of the role it assumes)"""
+    return vicloud.cache_lock(
+        f"credentials {role_arn or session.profile_name}",
+    )
+
+
+def setup_org_sessions(verbose, profile, role_name, regions):
+    """Find all the accounts in the AWS Organization, and set up a session
+    for each one by assuming the named role into it"""
+    source = get_session(profile)
+
+    # TODO: use a common logger (see base.log())
+    if verbose:
+        print(f"{profile}: list_accounts", file=sys.stderr)
+
+    client = source.client("sts", config=client_config("sts"))
+    own_account = client.get_caller_identity()["Account"]
+
+    accounts = []
+    client = source.client(
+        "organizations",
+        config=client_config("organizations"),
+    )
+    paginator = client.get_paginator("list_accounts")
+    for page in paginator.paginate():
+        for account in page["Accounts"]:
+            if account["Status"] != "ACTIVE":
+                continue
+            accounts.append(account["Id"])
+
+    client_lock = threading.Lock()
+
+    def setup_one(account_id):
+        role_arn = f"arn:aws:iam::{account_id}:role/{role_name}"
+        if account_id == own_account:
+            # No need to assume a role into the account we are already in,
+            # but the source session is shared with the other threads
+            session = source
+            role_arn = None
+            session_lock = client_lock
+        else:
+            session = _assume_role_session(source, role_arn, client_lock)
+            session_lock = None
+
+        try:
+            # Fetch the credentials now, while we are running concurrently
+            with _credentials_lock(session, role_arn):
+                session.get_credentials().get_frozen_credentials()
+        except (
+                botocore.exceptions.BotoCoreError,
+                botocore.exceptions.ClientError,
+        ) as e:
+            code = _error_code(e)
+            # TODO: use a common logger (see base.log())
+            print(f"{account_id}: ERROR: {code}, skipping", file=sys.stderr)
+            return session, role_arn, []
+
+        this_regions = _session_regions(
+            verbose,
+            account_id,
+            session,
+            regions,
+            session_lock,
+        )
+        return session, role_arn, this_regions
+
+    sessions = []
+    with concurrent.futures.ThreadPoolExecutor(ORG_WORKERS) as executor:
+        results = executor.map(setup_one, accounts)
+
+        for account_id, result in zip(accounts, results):
+            session, role_arn, this_regions = result
+            for region in this_regions:
+                this = {
+                    "enable": True,
+                    "profile": account_id,
+                    "region": region,
+                    "session": session,
+                    # Enough to set the session up again in another process
+                    "source_profile": profile,
+                    "role_arn": role_arn,
+                }
+                sessions.append(this)
+
+    return sessions
+
+
+_role_sessions = {}
+_role_sessions_lock = threading.Lock()
+
+
+def restore_session(this):
+    """Given a session dict without its session object (as sent to another
+    process), return a copy with the session set up again"""
+    this = dict(this)
+    profile = this.get("source_profile", this["profile"])
+    role_arn = this.get("role_arn")
+    if role_arn is None:
+        this["session"] = get_session(profile)
+        return this
+
+    source = get_session(profile)
+    with _role_sessions_lock:
+        session = _role_sessions.get(role_arn)
+        if session is None:
+            client_lock = threading.Lock()
+            session = _assume_role_session(source, role_arn, client_lock)
+            _role_sessions[role_arn] = session
+    this["session"] = session
+    return this
+
+
+# The state of each fetch_processes() worker process
+_worker = {}
+
+
+def _worker_state():
+    """Return the settings to send to a worker process"""
+    return {
+        "transport": _transport,
+        "negative": _negative,
+        "deadlines": _deadlines,
+        "prefetch": _prefetch,
+        "parsing": _parsing,
+    }
+
+
+def _worker_setup(args, state):
+    """Initialise a fetch_processes() worker"""
+    _transport.update(state["transport"])
+    _client_configs.clear()
+    _negative.update(state["negative"])
+    _deadlines.update(state["deadlines"])
+    _prefetch.update(state["prefetch"])
+    _parsing.update(state["parsing"])
+    _worker["args"] = args
+    _worker["handlers"] = {}
+
+
+def _worker_fetch(unit):
+    """Fetch one (handler class, session) unit in a worker process, and
+    return a picklable result"""
+    cls, this = unit
+    args = _worker["args"]
+
+    handler = _worker["handlers"].get(cls)
+    if handler is None:
+        handler = cls()
+        handler.verbose = args.verbose
+        handler.setup(args)
+        _worker["handlers"][cls] = handler
+
+    try:
+        resultset = handler.fetch_session(args, restore_session(this))
+    finally:
+        # The units are spread over the workers, so any parent results
+        # fetched for this one are not kept for the next
+        clear_shared()
+    return _definition_result(resultset)
+
+
+def _fetch_units(handlers, sessions, keep_session=False):
+    """Return the list of (handler class, session) units to fetch"""
+    units = []
+    for cls in handlers:
+        for this in cls.units(sessions):
+            if not keep_session:
+                # The session object cannot be sent to another process, the
+                # worker sets it up again
+                this = {k: v for k, v in this.items() if k != "session"}
+            units.append((cls, this))
+    return units
+
+
+def _definition_result(resultset):
+    """Turn a Definition (or None) into a picklable result"""
+    if resultset is None:
+        return None
+    return (
+        resultset.datatype,
+        resultset.datasource.profile,
+        resultset.datasource.region,
+        resultset.datasource.single_region,
+        resultset.data,
+    )
+
+
+def _result_definition(result):
+    """Turn a picklable result back into a Definition"""
+    datatype, profile, region, single_region, data = result
+    datasource = DataSource(profile, region)
+    datasource.single_region = single_region
+
+    resultset = definitionset.Definition()
+    resultset.datasource = datasource
+    resultset.datatype = datatype
+    resultset.data = data
+    return resultset
+
+
+def fetch_processes(args, units):
+    """Fetch the units, spread across args.processes worker processes,
+    yielding each result in order"""
+    with multiprocessing.Pool(
+        args.processes,
+        initializer=_worker_setup,
+        initargs=(args, _worker_state()),
+    ) as pool:
+        yield from pool.imap(_worker_fetch, units)
+
+
+def parse_address(value):
+    """Parse a "host:port" string into an address tuple"""
+    host, _, port = value.rpartition(":")
+    return (host or "localhost", int(port))
+
+
+def run_worker(address, authkey):
+    """Connect to a coordinator and fetch the units it sends, until it
+    has no more"""
+    with multiprocessing.connection.Client(address, authkey=authkey) as conn:
+        _worker_setup(*conn.recv())
+
+        while True:
+            work = conn.recv()
+            if work is None:
+                return
+            index, unit = work
+
+            try:
+                result = _worker_fetch(unit)
+            except Exception as e:
+                conn.send((index, False, e))
+                continue
+            conn.send((index, True, result))
+
+
+# Give up on a unit once this many workers have been lost while fetching it
+COORDINATOR_MAX_LOSSES = 3
+
+
+def _coordinator_lost(work, todo, results):
+    """A worker was lost while fetching this unit, so give the unit to
+    another one, unless it seems to be what is killing them"""
+    index, unit, losses = work
+    losses += 1
+    if losses < COORDINATOR_MAX_LOSSES:
+        todo.put((index, unit, losses))
+        return
+
+    cls, this = unit
+    error = RuntimeError(
+        f"{this['profile']}:{this['region']}:{cls.datatype}:"
+        f" lost {losses} workers while fetching"
+    )
+    results.put((index, False, error))
+
+
+def _coordinator_serve(conn, args, todo, results, done):
+    """Send units to one connected worker, and collect its results"""
+    with conn:
+        try:
+            conn.send((args, _worker_state()))
+        except (EOFError, OSError):
+            return
+
+        while not done.is_set():
+            try:
+                work = todo.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            index, unit, losses = work
+            try:
+                conn.send((index, unit))
+                results.put(conn.recv())
+            except (EOFError, OSError):
+                _coordinator_lost(work, todo, results)
+                return
+            except Exception as e:
+                # Could not send the unit, or read the reply
+                results.put((index, False, e))
+                return
+
+        try:
+            conn.send(None)
+        except (EOFError, OSError):
+            return
+
+
+def _coordinator_accept(listener, args, todo, results, done):
+    """Start serving each worker as it connects"""
+    while not done.is_set():
+        try:
+            conn = listener.accept()
+        except (
+                OSError,
+                multiprocessing.AuthenticationError,
+        ):
+            continue
+        thread = threading.Thread(
+            target=_coordinator_serve,
+            args=(conn, args, todo, results, done),
+            daemon=True,
+        )
+        thread.start()
+
+
+def fetch_coordinator(args, units):
+    """Fetch the units by handing them out to any workers that connect (see
+    run_worker()), yielding each result in order.
+
+    With args.local_workers, that many worker processes are started here"""
+    authkey = args.authkey
+    if authkey is None:
+        if not args.local_workers or args.coordinator:
+            raise ValueError("Need --authkey to accept remote workers")
+        authkey = os.urandom(16).hex()
+    authkey = authkey.encode("utf8")
+
+    address = ("localhost", 0)
+    if args.coordinator:
+        address = parse_address(args.coordinator)
+
+    todo = queue.Queue()
+    for index, unit in enumerate(units):
+        todo.put((index, unit, 0))
+    results = queue.Queue()
+    done = threading.Event()
+
+    listener = multiprocessing.connection.Listener(address, authkey=authkey)
+    threading.Thread(
+        target=_coordinator_accept,
+        args=(listener, args, todo, results, done),
+        daemon=True,
+    ).start()
+
+    # TODO: use a common logger (see base.log())
+    if args.verbose:
+        host, port = listener.address
+        print(f"coordinator: listening on {host}:{port}", file=sys.stderr)
+
+    def start_worker():
+        worker = multiprocessing.Process(
+            target=run_worker,
+            args=(listener.address, authkey),
+        )
+        worker.start()
+        return worker
+
+    workers = [start_worker() for _ in range(args.local_workers)]
+
+    try:
+        # Yield in the original order, holding back any that finish early
+        pending = {}
+        for index in range(len(units)):
+            while index not in pending:
+                try:
+                    got, ok, result = results.get(timeout=1)
+                except queue.Empty:
+                    # Replace any local workers that have died, their units
+                    # have already been given back
+                    for i, worker in enumerate(workers):
+                        if worker.is_alive():
+                            continue
+                        worker.join()
+                        # TODO: use a common logger (see base.log())
+                        print(
+                            f"coordinator: worker exited with"
+                            f" {worker.exitcode}, restarting",
+                            file=sys.stderr,
+                        )
+                        workers[i] = start_worker()
+                    continue
+                if not ok:
+                    raise result
+                pending[got] = result
+
+            yield pending.pop(index)
+    finally:
+        done.set()
+        listener.close()
+        for worker in workers:
+            worker.join()
+
+
+def _unit_key(cls, this):
+    """Return the key identifying a unit in the journal"""
+    return (cls.datatype, this["profile"], this["region"])
+
+
+_journal = None
+
+
+def setup_journal(journal):
+    """Record each completed unit in the journal, and replay any that it
+    already has instead of fetching them again"""
+    global _journal
+    _journal = journal
+
+
+def _journaled(units, fetch):
+    """Yield the Definition for each unit, replaying the journal where it
+    can and otherwise taking the results of fetch() for the rest"""
+    todo = units
+    if _journal is not None:
+        todo = [unit for unit in units if _unit_key(*unit) not in _journal]
+
+    if todo:
+        results = fetch(todo)
+
+    for unit in units:
+        key = _unit_key(*unit)
+        if _journal is not None and key in _journal:
+            result = _journal.get(key)
+        else:
+            result = next(results)
+            if _journal is not None:
+                _journal.record(key, result)
+
+        if result is not None:
+            yield _result_definition(result)
+
+    if todo:
+        # Let the fetch finish, and tidy up after itself
+        for _ in results:
+            pass
+
+
+# The duration to assume for a handler that has not been timed before
+DAG_DEFAULT_DURATION = 1.0
+
+
+def _shared_key(parent, cls, this):
+    """Return the key of the parent results used by a unit of cls"""
+    return (parent, this["profile"], cls.datasource_region(this["region"]))
+
+
+def _dag_ranks(units, children, durations):
+    """Return, for each unit, the expected duration of the longest chain of
+    units that starts with it"""
+    ranks = {}
+
+    def rank(index):
+        if index not in ranks:
+            cls = units[index][0]
+            own = durations.get(cls.datatype, {}).get(
+                "duration",
+                DAG_DEFAULT_DURATION,
+            )
+            ranks[index] = own + max(
+                (rank(child) for child in children[index]),
+                default=0,
+            )
+        return ranks[index]
+
+    for index in range(len(units)):
+        rank(index)
+    return ranks
+
+
+def fetch_dag(args, units):
+    """Fetch the units in this process, using args.dag_workers threads,
+    yielding each result in order.
+
+    A unit waits for the units of its parent handlers in the same profile
+    and region, and of the units that are ready, those starting the longest
+    chain (using the durations from earlier runs) are started first"""
+    index_of = {}
+    for index, (cls, this) in enumerate(units):
+        index_of[(cls, this["profile"], this["region"])] = index
+
+    children = [[] for _ in units]
+    waiting = [0] * len(units)
+    # How many units still need each shared parent result
+    users = collections.Counter()
+    for index, (cls, this) in enumerate(units):
+        for parent in cls.parent_classes():
+            key = (parent, this["profile"], this["region"])
+            if key in index_of:
+                children[index_of[key]].append(index)
+                waiting[index] += 1
+            users[_shared_key(parent, cls, this)] += 1
+
+    durations = vicloud.cache_load("durations.json")
+    ranks = _dag_ranks(units, children, durations)
+
+    ready = []
+    for index in range(len(units)):
+        if not waiting[index]:
+            heapq.heappush(ready, (-ranks[index], index))
+
+    # One handler for each class, shared by all its units
+    handlers = {}
+    for cls, this in units:
+        if cls not in handlers:
+            handler = cls()
+            handler.verbose = args.verbose
+            handler.setup(args)
+            handlers[cls] = handler
+
+    timings = collections.defaultdict(list)
+
+    def run(index):
+        cls, this = units[index]
+        start = time.monotonic()
+        # A parent unit shares its results with its children
+        share = bool(children[index])
+        resultset = handlers[cls].fetch_session(args, this, share)
+        timings[cls.datatype].append(time.monotonic() - start)
+        return _definition_result(resultset)
+
+    executor = concurrent.futures.ThreadPoolExecutor(args.dag_workers)
+    try:
+        running = {}
+        results = {}
+        next_index = 0
+        while next_index < len(units):
+            while ready and len(running) < args.dag_workers:
+                _, index = heapq.heappop(ready)
+                running[executor.submit(run, index)] = index
+
+            done, _ = concurrent.futures.wait(
+                running,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                index = running.pop(future)
+                results[index] = future.result()
+
+                # Release the parent results once no more units need them
+                cls, this = units[index]
+                for parent in cls.parent_classes():
+                    key = _shared_key(parent, cls, this)
+                    users[key] -= 1
+                    if not users[key]:
+                        release_shared(*key)
+
+                for child in children[index]:
+                    waiting[child] -= 1
+                    if not waiting[child]:
+                        heapq.heappush(ready, (-ranks[child], child))
+
+            # Yield in the original order, holding back any that finish early
+            while next_index in results:
+                yield results.pop(next_index)
+                next_index += 1
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        clear_shared()
+
+    # Remember the average duration of each handler, for the next run
+    for datatype, times in timings.items():
+        durations[datatype] = {
+            "duration": sum(times) / len(times),
+            "time": time.time(),
+        }
+    vicloud.cache_save("durations.json", durations)
+
+
+def clear_shared():
+    """Forget the shared results of the parent handlers"""
+    with _shared_lock:
+        _shared.clear()
+
+
+def release_shared(cls, profile=None, region=None):
+    """Forget the shared results of one parent handler class, for every
+    profile and region or for just the given one"""
+    with _shared_lock:
+        for key in list(_shared):
+            if key[0] is not cls:
+                continue
+            if profile is not None and key[1:] != (profile, region):
+                continue
+            del _shared[key]
+
+
+def _unchanged(item):
+    return item
+
+
+def fetch_parallel(args, handlers, sessions):
+    """Return an iterator over the Definitions fetched by other processes
+    or threads, or None if the fetch should be done one at a time"""
+    keep_session = False
+    if args.coordinator or args.local_workers:
+        fetch = fetch_coordinator
+    elif args.processes > 1:
+        fetch = fetch_processes
+    elif args.dag_workers > 1:
+        fetch = fetch_dag
+        keep_session = True
+    else:
+        return None
+
+    units = _fetch_units(handlers, sessions, keep_session)
+    return _journaled(units, lambda todo: fetch(args, todo))
+
+
+def project(item, fields):
+    """Return just the selected top level fields of the item"""
+    if not fields or not isinstance(item, dict):
+        return item
+    return {k: v for k, v in item.items() if k in fields}
+
+
+# Only strings up to this length are shared by compact(), longer ones are
+# rarely repeated, so would just grow the table
+COMPACT_MAXLEN = 64
+
+
+def compact(value, table):
+    """Return a copy of the value with repeated strings shared.
+
+    Each equal string (as a dict key or value) is replaced with the first
+    copy of it found in the table, so many copies of the same VpcId,
+    SubnetId, tag key and so on only take the memory of one"""
+    if isinstance(value, str):
+        if len(value) > COMPACT_MAXLEN:
+            return value
+        return table.setdefault(value, value)
+    if isinstance(value, dict):
+        result = {}
+        for k, v in value.items():
+            if isinstance(k, str):
+                k = table.setdefault(k, k)
+            result[k] = compact(v, table)
+        return result
+    if isinstance(value, list):
+        return [compact(v, table) for v in value]
+    return value
+
+
 class base:
     single_region = False
     dump = False
 
+    # The names of methods that normalise a single item.  Each one is given
+    # the item and returns it (possibly changed), or None to drop it.  The
+    # steps declared by all the parent classes are combined, base classes
+    # first, and applied in a single pass as each item is fetched.
+    item_steps = ()
+
+    # Any fields that the item_steps need to see, even if they were not
+    # selected with --fields
+    mutate_fields = []
+
+    # Set for handlers that pass each item through _item() as it is parsed
+    per_item = False
+
+    # The names of the handler classes, in the same module, whose results
+    # this handler uses (see _parent_data())
+    parents = ()
+
     def __init__(self):
         self.verbose = 0
 
+        # The per item processing, until fetch() sets up the options
+        self._item = self._compile_item()
+
+        # When the first region was fetched, for the time budget
+        self._started = None
+
+    @classmethod
+    def _steps(cls):
+        """Return the combined item_steps functions, found once per class"""
+        if "_steps_cache" not in cls.__dict__:
+            names = []
+            for klass in reversed(cls.__mro__):
+                for name in klass.__dict__.get("item_steps", ()):
+                    if name not in names:
+                        names.append(name)
+            cls._steps_cache = tuple(getattr(cls, name) for name in names)
+        return cls._steps_cache
+
+    def _compile_item(self, where=None, fields=None, table=None):
+        """Compose the --where filter, the --fields projection, all the
+        item_steps and the --compact string sharing into one function to
+        apply to each item"""
+        steps = self._steps()
+
+        keep = None
+        if fields:
+            keep = fields
+            if steps:
+                keep = fields | frozenset(self.mutate_fields)
+        # Only need a second projection if keep added some fields
+        drop = keep != fields
+
+        def item_func(item):
+            if where is not None and not where.search(item):
+                return None
+            if keep is not None:
+                item = project(item, keep)
+            for step in steps:
+                item = step(self, item)
+                if item is None:
+                    return None
+            if drop:
+                item = project(item, fields)
+            if table is not None:
+                item = compact(item, table)
+            return item
+
+        return item_func
+
     def log(self, datasource, message):
         profile = datasource.profile
         region = datasource.region
@@ -130,166 +1533,380 @@ class base:
     def log_operator(self, datasource, operation):
         self.log(datasource, f"fetch {operation}")
 
+    @classmethod
+    def schema_fields(cls):
+        """Return the list of fields expected in each item, if known"""
+        return None
+
+    @classmethod
+    def schemas(cls):
+        """Return the expected fields for each datatype we will fetch"""
+        return {cls.datatype: cls.schema_fields()}
+
     def fetch(self, args, sessions):
-        db = definitionset.DefinitionSet()
-        profiles_done = {}
-        for session in sessions:
-            if not session["enable"]:
-                # Skip sessions that have become error disabled
+        """Return a DefinitionSet with one Definition per session"""
+        db = definitionset.DefinitionSet(self.fetch_iter(args, sessions))
+        if not args.stream:
+            db.collect()
+        return db
+
+    def fetch_iter(self, args, sessions):
+        """Yield each Definition as soon as its session has been fetched"""
+        parallel = fetch_parallel(args, [type(self)], sessions)
+        if parallel is not None:
+            yield from parallel
+            return
+
+        self.setup(args)
+        for session in self.units(sessions):
+            key = _unit_key(type(self), session)
+            if _journal is not None and key in _journal:
+                # Already fetched by an earlier, interrupted, run
+                result = _journal.get(key)
+                if result is not None:
+                    yield _result_definition(result)
                 continue
 
-            profile_name = session["session"].profile_name
-            region_name = session["region"]
+            resultset = self.fetch_session(args, session)
+            if _journal is not None:
+                _journal.record(key, _definition_result(resultset))
+            if resultset is not None:
+                yield resultset
 
-            if self.single_region:
-                # If this is a global resource, override the region name
-                # TODO: is there a region name string that AWS uses for this?
-                region_name = "__SINGLE_REGION"
+    def setup(self, args):
+        """Prepare the per item processing for the options in args"""
+        where = None
+        if args.where:
+            where = jmespath.compile(args.where)
 
-                if profile_name in profiles_done:
-                    # skip all but the first region
-                    continue
-            profiles_done[profile_name] = True
+        fields = None
+        if args.fields:
+            fields = frozenset(args.fields)
+
+        # When compacting, share strings across all the regions fetched
+        table = None
+        if args.compact:
+            table = {}
 
-            datasource = DataSource(profile_name, region_name)
+        self._item = self._compile_item(where, fields, table)
 
-            resultset = definitionset.Definition()
-            resultset.datasource = datasource
-            resultset.datatype = self.datatype
+    @classmethod
+    def units(cls, sessions):
+        """Yield the sessions that this handler needs to fetch from"""
+        profiles_done = {}
 
-            client = datasource.client(self.service_name)
+        for session in sessions:
+            if not session["enable"]:
+                # Skip sessions that have become error disabled
+                continue
 
-            # stash our datasource to simplify the transition period
-            client._datasource = datasource
+            profile_name = session["profile"]
 
-            try:
-                specifics = self._fetch_one_client(client, args=args)
-            except botocore.exceptions.ClientError as e:
-                skip_codes = [
-                    "AuthFailure",
-                    "InvalidClientTokenId",
-                    "UnsupportedOperation",
-                ]
-                code = e.response["Error"]["Code"]
-
-                if code in skip_codes:
-                    self.log(datasource, f"ERROR: {code}, skipping")
-                    specifics = None
-
-                    # Skip this region for the rest of this run
-                    session["enable"] = False
-                else:
-                    raise
-            except botocore.exceptions.TokenRetrievalError:
-                # Attempt to provide a better error-message experience
-                raise ValueError("TokenRetrievalError: probably not logged in")
+            if negative_known(profile_name, session["region"]):
+                # An earlier run found that this region cannot be used
+                continue
 
-            if not specifics:
+            if cls.single_region and profile_name in profiles_done:
+                # If this is a global resource, skip all but the first region
                 continue
+            profiles_done[profile_name] = True
 
-            self._mutate(specifics)
+            yield session
 
-            resultset.data = specifics
-            db.append(resultset)
+    @classmethod
+    def datasource_region(cls, region):
+        """Return the region name used for the datasource of this handler"""
+        if cls.single_region:
+            # If this is a global resource, override the region name
+            # TODO: is there a region name string that AWS uses for this?
+            return "__SINGLE_REGION"
+        return region
+
+    def fetch_session(self, args, session, share=False):
+        """Fetch from one session, returning a Definition or None.
+
+        With share, the results are also kept for any child handlers (see
+        _parent_data()), instead of them each fetching the same again"""
+        if not session["enable"]:
+            # An earlier handler found this region cannot be used
+            return None
+
+        profile_name = session["profile"]
+        region_name = session["region"]
+
+        budget = _deadlines["budget"]
+        if budget is not None:
+            if self._started is None:
+                self._started = time.monotonic()
+            elif time.monotonic() - self._started > budget:
+                self.log(
+                    DataSource(profile_name, region_name),
+                    f"ERROR: over the {budget}s budget, skipping",
+                )
+                return None
+
+        region_name = self.datasource_region(region_name)
+
+        datasource = DataSource(
+            profile_name,
+            region_name,
+            session=session["session"],
+        )
 
-        return db
+        resultset = definitionset.Definition()
+        resultset.datasource = datasource
+        resultset.datatype = self.datatype
+
+        operation = getattr(self, "operator", None)
+        if operation is not None and negative_known(
+                profile_name,
+                session["region"],
+                self.service_name,
+                operation,
+        ):
+            self.log(datasource, f"{operation} is unsupported, skipping")
+            return None
+
+        client = datasource.client(self.service_name)
+
+        # stash our datasource to simplify the transition period
+        client._datasource = datasource
+
+        try:
+            if share:
+                specifics = self._shared_data(client)
+            else:
+                specifics = self._fetch_one_client(client, args=args)
+        except botocore.exceptions.ClientError as e:
+            code = e.response["Error"]["Code"]
+
+            if code in REGION_SKIP_CODES or code in OPERATION_SKIP_CODES:
+                self.log(datasource, f"ERROR: {code}, skipping")
+                specifics = None
+
+                # Skip this region for the rest of this run
+                session["enable"] = False
+
+                # And remember it for later runs, unless the credentials
+                # are what is failing
+                if code in REGION_SKIP_CODES:
+                    if _negative["ttl"] and negative_credentials_work(
+                            profile_name,
+                            session["session"],
+                    ):
+                        negative_record(profile_name, session["region"])
+                else:
+                    negative_record(
+                        profile_name,
+                        session["region"],
+                        self.service_name,
+                        botocore.xform_name(e.operation_name),
+                    )
+            else:
+                raise
+        except TimeoutError:
+            # Only this call missed its deadline, so the region is left
+            # enabled for the other handlers
+            self.log(datasource, "ERROR: deadline exceeded, skipping")
+            specifics = None
+        except botocore.exceptions.TokenRetrievalError:
+            # Attempt to provide a better error-message experience
+            raise ValueError("TokenRetrievalError: probably not logged in")
+
+        if not specifics:
+            return None
+
+        if not self.per_item:
+            # Handlers with their own parsing get the same per item
+            # processing once their region has been fetched
+            result = {}
+            for _id, item in specifics.items():
+                item = self._item(item)
+                if item is not None:
+                    result[_id] = item
+            specifics = result
+
+        if not specifics:
+            return None
+
+        self._mutate(specifics)
+
+        resultset.data = specifics
+        return resultset
 
     def _mutate(self, data):
-        """Optionally mutate data before storing it"""
+        """Optionally mutate the whole region of data before storing it.
+        Changes to single items should use item_steps instead"""
         return
 
     def _fetch_one_client(self, client, args=None):
         raise NotImplementedError
 
+    @classmethod
+    def parent_classes(cls):
+        """Return the classes named in parents"""
+        module = sys.modules[cls.__module__]
+        return [getattr(module, name) for name in cls.parents]
+
+    def _parent_data(self, cls, client):
+        """Return the results of the parent handler class, fetched only once
+        for each profile and region and then shared with every child"""
+        datasource = client._datasource
+        key = (cls, datasource.profile, datasource.region)
+
+        with _shared_lock:
+            future = _shared.get(key)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                _shared[key] = future
+
+        if owner:
+            handler = cls()
+            handler.verbose = self.verbose
+            # Share the items as they were fetched, each user of them does
+            # its own processing
+            handler._item = _unchanged
+            try:
+                future.set_result(handler._fetch_one_client(client))
+            except BaseException as e:
+                future.set_exception(e)
+
+        return future.result()
+
+    def _shared_data(self, client):
+        """Fetch this handler's own results through _parent_data(), so that
+        they are shared with its children"""
+        data = self._parent_data(type(self), client)
+        if self._steps():
+            # The steps can change items in place, but the children need
+            # them as they were fetched
+            data = copy.deepcopy(data)
+
+        if not self.per_item:
+            # fetch_session() does the per item processing
+            return data
+
+        result = {}
+        for _id, item in data.items():
+            item = self._item(item)
+            if item is not None:
+                result[_id] = item
+        return result
+
+    def _pages(self, client, args=None):
+        """Yield the pages from the handler's operator"""
+        return self._paged_op(client, self.operator)
+
     def apply(self, data):
         raise NotImplementedError
 
     @classmethod
     def _paged_op(cls, client, operation, **kwargs):
         """Wrap possible pagination in a helper"""
+        # The PageSize can be given in the same way as for a botocore
+        # paginator
+        config = kwargs.pop("PaginationConfig", {})
+        pages = paginate(
+            client,
+            operation,
+            config.get("PageSize", 50),
+            **kwargs,
+        )
 
-        if not client.can_paginate(operation):
-            operator = getattr(client, operation)
-            yield operator(**kwargs)
-        else:
-            token = None
-            paginator = client.get_paginator(operation)
+        # Fetch the next page while this one is being processed
+        for page in prefetch(pages):
+            # TODO
+            # if not quiet and enough tags since last print
+            #   print stderr fetching ...
+            yield page
 
-            param = {
-                "PaginationConfig": {
-                    "PageSize": 50,
-                    "StartingToken": token,
-                }
-            }
-            param.update(kwargs)
 
-            response = paginator.paginate(**param)
+class _data_two_deep(base):
+    """Generic parser for simple structure with two layers"""
+    per_item = True
 
-            for page in response:
-                # TODO
-                # if not quiet and enough tags since last print
-                #   print stderr fetching ...
-                yield page
+    @classmethod
+    def schema_fields(cls):
+        """Find the item fields from the botocore output shape"""
+        session = botocore.session.get_session()
+        try:
+            model = session.get_service_model(cls.service_name)
+        except botocore.exceptions.UnknownServiceError:
+            return None
+
+        for name in model.operation_names:
+            if botocore.xform_name(name) == cls.operator:
+                shape = model.operation_model(name).output_shape
+                break
+        else:
+            return None
 
+        r1 = shape.members.get(cls.r1_key)
+        if r1 is None or r1.type_name != "list":
+            return None
+        if r1.member.type_name != "structure":
+            return None
+
+        return list(r1.member.members)
 
-class _data_two_deep(base):
-    """Generic parser for simple structure with two layers"""
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         data = {}
 
         self.log_operator(datasource, self.operator)
 
-        for r1 in datasource.operation(self.service_name, self.operator):
+        for r1 in self._pages(client, args):
             for r2 in r1[self.r1_key]:
                 _id = r2[self.r2_id]
-                data[_id] = r2
+                item = self._item(r2)
+                if item is not None:
+                    data[_id] = item
 
         return data
 
 
 class _mutate_sortarray(base):
     """Apply any array order stabilisation steps"""
+    item_steps = ("_item_sortarray",)
 
-    def _mutate(self, data):
-        # Chain to any other mutators
-        super()._mutate(data)
-
+    def _item_sortarray(self, item):
         def do_sort(array, orderby):
             def _key(item):
                 return item.get(orderby, None)
 
             return sorted(array, key=_key)
 
-        for _id, item in data.items():
-            for keyname, orderby in self.sortarray.items():
-                item[keyname] = do_sort(item[keyname], orderby)
+        for keyname, orderby in self.sortarray.items():
+            if keyname not in item:
+                continue
+            item[keyname] = do_sort(item[keyname], orderby)
+
+        return item
 
 
 class _mutate_sortTagsarray(base):
     """Apply stabilise the order of the Tags array"""
+    item_steps = ("_item_sortTagsarray",)
+
+    def _item_sortTagsarray(self, item):
+        if "Tags" not in item:
+            return item
+
+        tags = {}
+        for tag in item["Tags"]:
+            k = tag["Key"]
+            v = tag["Value"]
+            tags[k] = v
+
+        tagarray = []
+        for k in sorted(tags.keys()):
+            v = tags[k]
+            tag = {
+                "Key": k,
+                "Value": v,
+            }
+            tagarray.append(tag)
 
-    def _mutate(self, data):
-        # Chain to any other mutators
-        super()._mutate(data)
-
-        for _id, item in data.items():
-            if "Tags" not in item:
-                continue
-
-            tags = {}
-            for tag in item["Tags"]:
-                k = tag["Key"]
-                v = tag["Value"]
-                tags[k] = v
-
-            tagarray = []
-            for k in sorted(tags.keys()):
-                v = tags[k]
-                tag = {
-                    "Key": k,
-                    "Value": v,
-                }
-                tagarray.append(tag)
-
-            item["Tags"] = tagarray
+        item["Tags"] = tagarray
+        return item
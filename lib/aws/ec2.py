@@ -5,11 +5,44 @@ import aws
 _service_name = "ec2"
 datatype_prefix = "aws." + _service_name + "."
 
+# The most zones to fetch at once with --shard_zones
+ZONE_WORKERS = 8
+
 
 class base(aws.base):
     service_name = _service_name
 
 
+class _zone_sharded(aws.base):
+    """Optionally split one large listing into a listing per availability
+    zone, fetched in parallel"""
+
+    def _pages(self, client, args=None):
+        if args is None or not args.shard_zones:
+            yield from super()._pages(client, args)
+            return
+
+        zones = []
+        for page in self._paged_op(client, "describe_availability_zones"):
+            for zone in page["AvailabilityZones"]:
+                zones.append(zone["ZoneName"])
+
+        self.log(client._datasource, f"split into {len(zones)} zones")
+
+        def zone_pages(zone):
+            filters = [{"Name": "availability-zone", "Values": [zone]}]
+            return self._paged_op(client, self.operator, Filters=filters)
+
+        # Every item is in exactly one zone, and the callers key them by id,
+        # so the zones just need to be joined.  The pages are passed on as
+        # they arrive, so only a few are ever waiting to be processed
+        yield from aws.merge_pages(
+            [zone_pages(zone) for zone in zones],
+            ZONE_WORKERS,
+            ZONE_WORKERS,
+        )
+
+
 class account_attributes(base):
     datatype = datatype_prefix + "account_attributes"
     dump = True
@@ -105,25 +138,28 @@ class instance_types(base, aws._data_two_deep):
     r2_id = "InstanceType"
 
 
-class instances(base, aws._mutate_sortTagsarray):
+class instances(base, _zone_sharded, aws._mutate_sortTagsarray):
     datatype = datatype_prefix + "instances"
     dump = True
+    per_item = True
+    operator = "describe_instances"
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         data = {}
-        operator = "describe_instances"
         r1_key = "Reservations"
         r2_key = "Instances"
         r3_id = "InstanceId"
 
-        self.log_operator(datasource, operator)
+        self.log_operator(datasource, self.operator)
 
-        for r1 in self._paged_op(client, operator):
+        for r1 in self._pages(client, args):
             for r2 in r1[r1_key]:
                 for r3 in r2[r2_key]:
                     _id = r3[r3_id]
-                    data[_id] = r3
+                    item = self._item(r3)
+                    if item is not None:
+                        data[_id] = item
 
         return data
 
@@ -203,33 +239,27 @@ class network_interface_permissions(base, aws._data_two_deep):
     r2_id = "NetworkInterfacePermissionId"
 
 
-class network_interfaces(base, aws._data_two_deep):
+class network_interfaces(base, _zone_sharded, aws._data_two_deep):
     datatype = datatype_prefix + "network_interfaces"
     dump = True
     operator = "describe_network_interfaces"
     r1_key = "NetworkInterfaces"
     r2_id = "NetworkInterfaceId"
+    mutate_fields = ["RequesterManaged", "RequesterId"]
+    item_steps = ("_item_skip_elb",)
 
-    def _mutate(self, data):
+    def _item_skip_elb(self, item):
         """Remove AWS ELB interfaces from those we are interested in"""
         # These interfaces change on an almost daily basis, and are completely
         # managed by Amazon, so provide no value when trawling the deployed
         # data
 
-        # Chain to any other mutators
-        super()._mutate(data)
-
-        del_list = set()
-        for _id, item in data.items():
-            if not item["RequesterManaged"]:
-                continue
-            if item["RequesterId"] != "amazon-elb":
-                continue
+        if not item["RequesterManaged"]:
+            return item
+        if item["RequesterId"] != "amazon-elb":
+            return item
 
-            del_list.add(_id)
-
-        for _id in del_list:
-            del data[_id]
+        return None
 
 
 class prefix_lists(base, aws._data_two_deep):
@@ -273,16 +303,16 @@ class security_groups(base, aws._data_two_deep):
     r1_key = "SecurityGroups"
     r2_id = "GroupId"
 
-    def _mutate(self, data):
-        """Remove data that is duplicated in security_group_rules"""
+    item_steps = ("_item_remove_rules",)
 
-        # Chain to any other mutators
-        super()._mutate(data)
+    def _item_remove_rules(self, item):
+        """Remove data that is duplicated in security_group_rules"""
 
-        for _id, item in data.items():
-            del item["IpPermissionsEgress"]
-            del item["IpPermissions"]
-            del item["OwnerId"]
+        # These may already have been removed by --fields
+        item.pop("IpPermissionsEgress", None)
+        item.pop("IpPermissions", None)
+        item.pop("OwnerId", None)
+        return item
 
 
 class snapshots(base, aws._data_two_deep):
@@ -348,7 +378,7 @@ class volume_status(base, aws._data_two_deep):
     r2_id = "VolumeId"
 
 
-class volumes(base, aws._data_two_deep):
+class volumes(base, _zone_sharded, aws._data_two_deep):
     datatype = datatype_prefix + "volumes"
     dump = True
     operator = "describe_volumes"
@@ -12,13 +12,12 @@ class base(aws.base):
 
 class _cluster_foreach(base):
     cluster_param_name = "clusterName"
+    parents = ("list_clusters",)
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of clusters
-        handler = list_clusters()
-        handler.verbose = self.verbose
-        names = handler._fetch_one_client(client)
+        names = self._parent_data(list_clusters, client)
 
         self.log_operator(datasource, self.operator)
 
@@ -35,6 +34,7 @@ class _cluster_foreach(base):
 
 class access_entries(base):
     datatype = datatype_prefix + "access_entry"
+    parents = ("list_clusters", "list_access_entries")
     dump = True
     operator = "describe_access_entry"
     r1_key = "accessEntry"
@@ -43,15 +43,11 @@ class access_entries(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of clusters
-        handler = list_clusters()
-        handler.verbose = self.verbose
-        clusters = handler._fetch_one_client(client)
+        clusters = self._parent_data(list_clusters, client)
 
         data = {}
         for cluster in clusters.keys():
-            handler = list_access_entries()
-            handler.verbose = self.verbose
-            access_entries = handler._fetch_one_client(client)
+            access_entries = self._parent_data(list_access_entries, client)
 
             self.log_operator(datasource, self.operator)
 
@@ -69,6 +65,7 @@ class access_entries(base):
 
 class addon(base):
     datatype = datatype_prefix + "addon"
+    parents = ("list_clusters", "list_addons")
     dump = True
     operator = "describe_addon"
     r1_key = "addon"
@@ -77,15 +74,11 @@ class addon(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of clusters
-        handler = list_clusters()
-        handler.verbose = self.verbose
-        clusters = handler._fetch_one_client(client)
+        clusters = self._parent_data(list_clusters, client)
 
         data = {}
         for cluster in clusters.keys():
-            handler = list_addons()
-            handler.verbose = self.verbose
-            addons = handler._fetch_one_client(client)
+            addons = self._parent_data(list_addons, client)
 
             self.log_operator(datasource, self.operator)
 
@@ -133,23 +126,21 @@ class insights(_cluster_foreach):
 
 class nodegroup(base):
     datatype = datatype_prefix + "nodegroup"
+    parents = ("list_clusters", "list_nodegroups")
     dump = True
     operator = "describe_nodegroup"
     r1_key = "nodegroup"
     r2_id = "nodegroupName"
+    item_steps = ("_item_remove_modified",)
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of clusters
-        handler = list_clusters()
-        handler.verbose = self.verbose
-        clusters = handler._fetch_one_client(client)
+        clusters = self._parent_data(list_clusters, client)
 
         data = {}
         for cluster in clusters.keys():
-            handler = list_nodegroups()
-            handler.verbose = self.verbose
-            nodegroups = handler._fetch_one_client(client)
+            nodegroups = self._parent_data(list_nodegroups, client)
 
             self.log_operator(datasource, self.operator)
 
@@ -164,15 +155,15 @@ class nodegroup(base):
 
         return data
 
-    def _mutate(self, data):
+    def _item_remove_modified(self, item):
         # The modified date always appears to be "now"
-
-        for _id, item in data.items():
-            del item["modifiedAt"]
+        item.pop("modifiedAt", None)
+        return item
 
 
 class pod_identity_association(base):
     datatype = datatype_prefix + "pod_identity_association"
+    parents = ("list_clusters", "list_pod_identity_associations")
     dump = True
     operator = "describe_pod_identity_association"
     r1_key = "association"
@@ -181,15 +172,11 @@ class pod_identity_association(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of clusters
-        handler = list_clusters()
-        handler.verbose = self.verbose
-        clusters = handler._fetch_one_client(client)
+        clusters = self._parent_data(list_clusters, client)
 
         data = {}
         for cluster in clusters.keys():
-            handler = list_pod_identity_associations()
-            handler.verbose = self.verbose
-            pods = handler._fetch_one_client(client)
+            pods = self._parent_data(list_pod_identity_associations, client)
 
             self.log_operator(datasource, self.operator)
 
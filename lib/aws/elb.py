@@ -12,14 +12,13 @@ class base(aws.base):
 
 class listener_attributes(base):
     datatype = datatype_prefix + "listener_attributes"
+    parents = ("listeners",)
     dump = True
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of load_balancers
-        handler = listeners()
-        handler.verbose = self.verbose
-        listenlist = handler._fetch_one_client(client)
+        listenlist = self._parent_data(listeners, client)
 
         arns = set()
         for _id, listener in listenlist.items():
@@ -45,14 +44,13 @@ class listener_attributes(base):
 
 class listener_certificates(base):
     datatype = datatype_prefix + "listener_certificates"
+    parents = ("listeners",)
     dump = True
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of load_balancers
-        handler = listeners()
-        handler.verbose = self.verbose
-        listenlist = handler._fetch_one_client(client)
+        listenlist = self._parent_data(listeners, client)
 
         arns = set()
         for _id, listener in listenlist.items():
@@ -76,14 +74,13 @@ class listener_certificates(base):
 
 class listeners(base):
     datatype = datatype_prefix + "listeners"
+    parents = ("load_balancers",)
     dump = True
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of load_balancers
-        handler = load_balancers()
-        handler.verbose = self.verbose
-        loadbalancers = handler._fetch_one_client(client)
+        loadbalancers = self._parent_data(load_balancers, client)
 
         arns = set()
         for _id, elb in loadbalancers.items():
@@ -107,14 +104,13 @@ class listeners(base):
 
 class load_balancer_attributes(base):
     datatype = datatype_prefix + "load_balancer_attributes"
+    parents = ("load_balancers",)
     dump = True
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of load_balancers
-        handler = load_balancers()
-        handler.verbose = self.verbose
-        loadbalancers = handler._fetch_one_client(client)
+        loadbalancers = self._parent_data(load_balancers, client)
 
         arns = set()
         for _id, elb in loadbalancers.items():
@@ -148,14 +144,13 @@ class load_balancers(base, aws._data_two_deep):
 
 class rules(base):
     datatype = datatype_prefix + "rules"
+    parents = ("listeners",)
     dump = True
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of listeners
-        handler = listeners()
-        handler.verbose = self.verbose
-        _list = handler._fetch_one_client(client)
+        _list = self._parent_data(listeners, client)
 
         arns = set()
         for _id, listener in _list.items():
@@ -188,14 +183,13 @@ class target_groups(base, aws._data_two_deep):
 
 class target_group_attributes(base):
     datatype = datatype_prefix + "target_group_attributes"
+    parents = ("target_groups",)
     dump = True
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of target_groups
-        handler = target_groups()
-        handler.verbose = self.verbose
-        listgroups = handler._fetch_one_client(client)
+        listgroups = self._parent_data(target_groups, client)
 
         arns = set()
         for _id, item in listgroups.items():
@@ -221,14 +215,13 @@ class target_group_attributes(base):
 
 class target_health(base):
     datatype = datatype_prefix + "target_health"
+    parents = ("target_groups",)
     dump = True
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of target_groups
-        handler = target_groups()
-        handler.verbose = self.verbose
-        listgroups = handler._fetch_one_client(client)
+        listgroups = self._parent_data(target_groups, client)
 
         arns = set()
         for _id, item in listgroups.items():
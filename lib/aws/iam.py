@@ -24,6 +24,7 @@ class get_account_authorization_details(base, aws._data_two_deep):
 
 class list_access_keys(base):
     datatype = datatype_prefix + "access_keys"
+    parents = ("list_users",)
     dump = True
     operator = "list_access_keys"
     single_region = True
@@ -33,9 +34,7 @@ class list_access_keys(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of users
-        handler = list_users()
-        handler.verbose = self.verbose
-        users = handler._fetch_one_client(client)
+        users = self._parent_data(list_users, client)
 
         data = {}
         for _id, user in users.items():
@@ -58,6 +57,7 @@ class list_access_keys(base):
 
 class list_attached_group_policies(base):
     datatype = datatype_prefix + "attached_group_policies"
+    parents = ("list_groups",)
     dump = True
     operator = "list_attached_group_policies"
     single_region = True
@@ -66,9 +66,7 @@ class list_attached_group_policies(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list
-        handler = list_groups()
-        handler.verbose = self.verbose
-        groups = handler._fetch_one_client(client)
+        groups = self._parent_data(list_groups, client)
 
         data = {}
         for _id, group in groups.items():
@@ -88,6 +86,7 @@ class list_attached_group_policies(base):
 
 class list_attached_role_policies(base):
     datatype = datatype_prefix + "attached_role_policies"
+    parents = ("list_roles",)
     dump = True
     operator = "list_attached_role_policies"
     single_region = True
@@ -96,9 +95,7 @@ class list_attached_role_policies(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list
-        handler = list_roles()
-        handler.verbose = self.verbose
-        roles = handler._fetch_one_client(client)
+        roles = self._parent_data(list_roles, client)
 
         data = {}
         for _id, role in roles.items():
@@ -118,6 +115,7 @@ class list_attached_role_policies(base):
 
 class list_attached_user_policies(base):
     datatype = datatype_prefix + "attached_user_policies"
+    parents = ("list_users",)
     dump = True
     operator = "list_attached_user_policies"
     single_region = True
@@ -126,9 +124,7 @@ class list_attached_user_policies(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of users
-        handler = list_users()
-        handler.verbose = self.verbose
-        users = handler._fetch_one_client(client)
+        users = self._parent_data(list_users, client)
 
         data = {}
         for _id, user in users.items():
@@ -161,6 +157,7 @@ class list_groups(base, aws._data_two_deep):
 
 class list_groups_for_user(base):
     datatype = datatype_prefix + "groups_for_user"
+    parents = ("list_users",)
     dump = True
     operator = "list_groups_for_user"
     single_region = True
@@ -169,9 +166,7 @@ class list_groups_for_user(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of users
-        handler = list_users()
-        handler.verbose = self.verbose
-        users = handler._fetch_one_client(client)
+        users = self._parent_data(list_users, client)
 
         data = {}
         for _id, user in users.items():
@@ -192,6 +187,7 @@ class list_groups_for_user(base):
 
 class list_mfa_devices(base):
     datatype = datatype_prefix + "mfa_devices"
+    parents = ("list_users",)
     dump = True
     operator = "list_mfa_devices"
     single_region = True
@@ -200,9 +196,7 @@ class list_mfa_devices(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of users
-        handler = list_users()
-        handler.verbose = self.verbose
-        users = handler._fetch_one_client(client)
+        users = self._parent_data(list_users, client)
 
         data = {}
         for _id, user in users.items():
@@ -240,6 +234,7 @@ class list_policies(base, aws._data_two_deep):
 
 class list_role_tags(base):
     datatype = datatype_prefix + "role_tags"
+    parents = ("list_roles",)
     dump = True
     operator = "list_role_tags"
     single_region = True
@@ -248,9 +243,7 @@ class list_role_tags(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of roles
-        handler = list_roles()
-        handler.verbose = self.verbose
-        roles = handler._fetch_one_client(client)
+        roles = self._parent_data(list_roles, client)
 
         data = {}
         for _id, role in roles.items():
@@ -291,6 +284,7 @@ class list_saml_providers(base, aws._data_two_deep):
 
 class list_user_policies(base):
     datatype = datatype_prefix + "user_policies"
+    parents = ("list_users",)
     dump = True
     operator = "list_user_policies"
     single_region = True
@@ -299,9 +293,7 @@ class list_user_policies(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of users
-        handler = list_users()
-        handler.verbose = self.verbose
-        users = handler._fetch_one_client(client)
+        users = self._parent_data(list_users, client)
 
         data = {}
         for _id, user in users.items():
@@ -321,6 +313,7 @@ class list_user_policies(base):
 
 class list_user_tags(base):
     datatype = datatype_prefix + "user_tags"
+    parents = ("list_users",)
     dump = True
     operator = "list_user_tags"
     single_region = True
@@ -329,9 +322,7 @@ class list_user_tags(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of users
-        handler = list_users()
-        handler.verbose = self.verbose
-        users = handler._fetch_one_client(client)
+        users = self._parent_data(list_users, client)
 
         data = {}
         for _id, user in users.items():
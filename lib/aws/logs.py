@@ -49,6 +49,7 @@ class streams(base):
     params = ['log_group_name']
     r1_key = "logStreams"
     r2_id = "logStreamName"
+    item_steps = ("_item_timefields",)
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
@@ -67,10 +68,7 @@ class streams(base):
 
         return data
 
-    def _mutate(self, data):
-        # Chain to any other mutators
-        super()._mutate(data)
-
+    def _item_timefields(self, item):
         timefields = [
             "creationTime",
             "firstEventTimestamp",
@@ -78,12 +76,13 @@ class streams(base):
             "lastIngestionTime",
         ]
 
-        for _id, item in data.items():
-            for i in timefields:
-                if i in item:
-                    timestamp = item[i] / 1000
-                    dt = datetime.datetime.fromtimestamp(
-                        timestamp,
-                        tz=datetime.timezone.utc
-                    ).astimezone()
-                    item[i] = dt.isoformat(timespec="milliseconds")
+        for i in timefields:
+            if i in item:
+                timestamp = item[i] / 1000
+                dt = datetime.datetime.fromtimestamp(
+                    timestamp,
+                    tz=datetime.timezone.utc
+                ).astimezone()
+                item[i] = dt.isoformat(timespec="milliseconds")
+
+        return item
@@ -44,14 +44,13 @@ class db_cluster_parameter_group(base, aws._data_two_deep):
 
 class db_cluster_parameter(base):
     datatype = datatype_prefix + "db_cluster_parameter"
+    parents = ("db_cluster_parameter_group",)
     dump = True
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of listeners
-        handler = db_cluster_parameter_group()
-        handler.verbose = self.verbose
-        _list = handler._fetch_one_client(client)
+        _list = self._parent_data(db_cluster_parameter_group, client)
 
         groups = set()
         for _id in _list.keys():
@@ -106,7 +105,9 @@ class db_engine_version(base, aws._data_two_deep):
         for r1 in self._paged_op(client, self.operator):
             for r2 in r1[self.r1_key]:
                 _id = ".".join([r2["Engine"], r2["EngineVersion"]])
-                data[_id] = r2
+                item = self._item(r2)
+                if item is not None:
+                    data[_id] = item
 
         return data
 
@@ -129,14 +130,13 @@ class db_instance(base, aws._data_two_deep):
 
 class db_log_file(base):
     datatype = datatype_prefix + "db_log_file"
+    parents = ("db_instance",)
     dump = False
 
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of listeners
-        handler = db_instance()
-        handler.verbose = self.verbose
-        _list = handler._fetch_one_client(client)
+        _list = self._parent_data(db_instance, client)
 
         instances = set()
         for _id in _list.keys():
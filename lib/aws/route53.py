@@ -21,6 +21,7 @@ class hosted_zones(base, aws._data_two_deep):
 
 class resource_record_sets(base):
     datatype = datatype_prefix + "resource_record_sets"
+    parents = ("hosted_zones",)
     dump = True
     operator = "list_resource_record_sets"
     r1_key = "ResourceRecordSets"
@@ -29,9 +30,7 @@ class resource_record_sets(base):
     def _fetch_one_client(self, client, args=None):
         datasource = client._datasource
         # first, get the list of clusters
-        handler = hosted_zones()
-        handler.verbose = self.verbose
-        zones = handler._fetch_one_client(client)
+        zones = self._parent_data(hosted_zones, client)
 
         data = {}
         for zone in zones.values():
@@ -17,6 +17,9 @@ class Definition:
     def __repr__(self):
         return str(self.__dict__)
 
+    def __len__(self):
+        return len(self.data)
+
     def csv_fields(self):
         """Return the field names of both metadata and data"""
         d = set()
@@ -54,31 +57,60 @@ class Definition:
 
 
 class DefinitionSet:
-    """A list of definitions"""
-    def __init__(self):
+    """A list of definitions
+
+    If created with a source iterator, the set is streaming: definitions
+    are pulled from the source only as the set is iterated and are not
+    kept, so a streaming set can only be iterated once.
+    """
+    def __init__(self, source=None):
         self._list = []
+        self._source = source
+        self._consumed = False
 
     def __repr__(self):
+        if self.streaming:
+            return "<streaming DefinitionSet>"
         return str(self._list)
 
+    def __iter__(self):
+        if not self.streaming:
+            return iter(self._list)
+        if self._consumed:
+            raise ValueError("streaming DefinitionSet already consumed")
+        self._consumed = True
+        return iter(self._source)
+
+    @property
+    def streaming(self):
+        return self._source is not None
+
     def append(self, data):
         self._list.append(data)
 
+    def collect(self):
+        """Pull all of a streaming source into this set, so it can be used
+        more than once"""
+        if not self.streaming:
+            return
+        self._list += list(self)
+        self._source = None
+
     def csv_fields(self):
         """Return the combined field names of all the definitions"""
         d = set()
-        for data in self._list:
+        for data in self:
             d.update(data.csv_fields())
         return d
 
     def csv_rows(self):
         """Yield the contents for csv"""
-        for data in self._list:
+        for data in self:
             for row in data.csv_rows():
                 yield row
 
     def canonical_data(self):
         """Yield the contents for storage"""
-        for data in self._list:
+        for data in self:
             for row in data.canonical_data():
                 yield row
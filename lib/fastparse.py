@@ -0,0 +1,205 @@
+"""
+A faster response parser for the botocore JSON protocols.
+
+The standard botocore parsers walk every value in a response against its
+shape, mostly just to copy it, which is a large part of the cost of big
+listings.  These parsers decode the body (with orjson, if it is installed)
+and then only visit the members that actually need converting - the
+timestamps, the blobs and any members with a different name on the wire.
+The steps needed for each shape are worked out once for each service and
+then shared by all the clients for it.
+
+As with the standard parsers, null members are dropped (this just costs a
+little more for the bodies that have any).  Unlike them, any members that
+the installed botocore model does not know about are left in place.
+"""
+
+import json
+import threading
+
+import botocore.parsers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# The service of the response being parsed in this thread, see before_parse()
+_context = threading.local()
+
+
+def before_parse(operation_model, **kwargs):
+    """Note the service of the response about to be parsed (a botocore
+    before-parse event handler), so that its parser can use the converters
+    already built for that service"""
+    service_model = operation_model.service_model
+    _context.service = (service_model.service_name, service_model.api_version)
+
+
+def loads(raw):
+    """Decode a json body, given as bytes"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+class _FastJSONMixin:
+    """Replace the shape walking of a botocore json parser"""
+
+    # Could the decoded body have any null values?
+    _nulls = True
+
+    def _parse_body_as_json(self, body_contents):
+        if not body_contents:
+            return {}
+        # Any text containing "null" is enough to take the slower path
+        self._nulls = b"null" in body_contents
+        try:
+            return loads(body_contents)
+        except ValueError:
+            # if the body cannot be parsed, include the literal string as
+            # the message, the same as botocore does
+            return {"message": body_contents.decode(self.DEFAULT_ENCODING)}
+
+    def _parse_shape(self, shape, node):
+        if not isinstance(node, (dict, list)):
+            # Leave scalars (eg, from headers) to the standard handlers
+            return super()._parse_shape(shape, node)
+
+        with self._converters_lock:
+            convert = self._converter(shape, self._nulls)
+        if convert is None:
+            return node
+        return convert(node)
+
+    def _converter(self, shape, nulls):
+        """Return a function to convert the decoded json for the shape, or
+        None if it needs no changes.  With nulls, the function also drops
+        any null members"""
+        # Shape names are unique within the service
+        key = (shape.name, nulls)
+        if key in self._converters:
+            convert = self._converters[key]
+            if convert is not _PENDING:
+                return convert
+
+            # A recursive shape, find its converter when it is used
+            def later(value):
+                convert = self._converters[key]
+                if convert is None:
+                    return value
+                return convert(value)
+            return later
+
+        self._converters[key] = _PENDING
+        self._converters[key] = self._build(shape, nulls)
+        return self._converters[key]
+
+    def _build(self, shape, nulls):
+        kind = shape.type_name
+
+        if kind == "timestamp":
+            return self._timestamp_parser
+        if kind == "blob":
+            return self._blob_parser
+
+        if kind == "list":
+            member = self._converter(shape.member, nulls)
+            if member is None:
+                return None
+
+            def convert_list(value):
+                return [member(i) if i is not None else i for i in value]
+            return convert_list
+
+        if kind == "map":
+            member = self._converter(shape.value, nulls)
+            if member is None:
+                return None
+
+            def convert_map(value):
+                return {
+                    k: member(v) if v is not None else v
+                    for k, v in value.items()
+                }
+            return convert_map
+
+        if kind != "structure" or shape.is_document_type:
+            return None
+
+        steps = []
+        for name, member_shape in shape.members.items():
+            wire_name = member_shape.serialization.get("name", name)
+            member = self._converter(member_shape, nulls)
+            if member is None and wire_name == name:
+                continue
+            steps.append((name, wire_name, member))
+
+        if not steps and not nulls:
+            return None
+
+        def convert_structure(value):
+            if nulls:
+                for k in [k for k, v in value.items() if v is None]:
+                    del value[k]
+            for name, wire_name, member in steps:
+                if wire_name not in value:
+                    continue
+                if wire_name != name:
+                    value[name] = value.pop(wire_name)
+                if member is not None:
+                    value[name] = member(value[name])
+            return value
+        return convert_structure
+
+
+# Marks a shape whose converter is still being built
+_PENDING = object()
+
+
+class JSONParser(_FastJSONMixin, botocore.parsers.JSONParser):
+    pass
+
+
+class RestJSONParser(_FastJSONMixin, botocore.parsers.RestJSONParser):
+    pass
+
+
+PROTOCOL_PARSERS = {
+    "json": JSONParser,
+    "rest-json": RestJSONParser,
+}
+
+
+class ResponseParserFactory(botocore.parsers.ResponseParserFactory):
+    """Create the fast parsers for the json protocols, and the standard
+    parsers for any others.
+
+    A new parser is created for every response, so the converters are kept
+    here, for each service, and shared by all of them.  The service is
+    given, or else taken from before_parse() (which needs to be registered
+    for the botocore "before-parse" event)"""
+
+    def __init__(self):
+        super().__init__()
+        self._converters = {}
+        self._converters_lock = threading.RLock()
+
+    def create_parser(self, protocol_name, service=None):
+        parser_cls = PROTOCOL_PARSERS.get(protocol_name)
+        if parser_cls is None:
+            return super().create_parser(protocol_name)
+        parser = parser_cls(**self._defaults)
+
+        if service is None:
+            service = getattr(_context, "service", None)
+        with self._converters_lock:
+            if service is None:
+                # Nothing to share with, so just keep them for this parser
+                converters = {}
+            else:
+                converters = self._converters.setdefault(service, {})
+        parser._converters = converters
+        parser._converters_lock = self._converters_lock
+        return parser
@@ -0,0 +1,44 @@
+"""
+Flatten nested resource data into simple columns, suitable for csv.
+
+Nested dicts become dotted column names (eg, "State.Name"), arrays of
+Key/Value tags become one column per tag (eg, "Tags.Name"), arrays of plain
+values are comma joined and any other arrays are stored as json.
+"""
+
+import json
+
+
+def _is_tag(item):
+    return isinstance(item, dict) and "Key" in item and "Value" in item
+
+
+def _flatten_list(value):
+    if all(not isinstance(i, (dict, list)) for i in value):
+        return ",".join(str(i) for i in value)
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def _flatten(prefix, row, result):
+    for k, v in row.items():
+        name = prefix + str(k)
+
+        if isinstance(v, dict):
+            _flatten(name + ".", v, result)
+        elif not isinstance(v, list):
+            result[name] = v
+        elif not v:
+            # An empty array adds no columns
+            continue
+        elif _is_tag(v[0]):
+            for tag in v:
+                result[f"{name}.{tag['Key']}"] = tag["Value"]
+        else:
+            result[name] = _flatten_list(v)
+
+
+def flatten(row):
+    """Return a flat copy of the row"""
+    result = {}
+    _flatten("", row, result)
+    return result
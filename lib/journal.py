@@ -0,0 +1,90 @@
+"""
+A journal of the fetch units that have been completed, so that an
+interrupted run can be resumed without fetching them again.
+
+Each unit is identified by a key (the datatype, profile and region) and its
+result is stored as it was returned, so a resumed run produces exactly the
+same output.  The journal file is a header followed by a stream of pickled
+(key, result) records, each one flushed as it is written - if the run is
+killed part way through a record, that record is just ignored.
+
+Only the results loaded to resume a run are kept in memory, anything
+recorded after that is only written to the file.
+"""
+
+import hashlib
+import os
+import pickle
+import vicloud
+
+
+class Journal:
+    """Record and replay the results of completed fetch units.
+
+    The header identifies the command being run, a journal can only be
+    resumed by the same command.  Unless a filename is given, the journal
+    is kept in the cache dir, named for the header"""
+    def __init__(self, header, filename=None, resume=False):
+        if filename is None:
+            digest = hashlib.sha1(repr(header).encode("utf8")).hexdigest()
+            filename = vicloud.cache_filename(f"journal.{digest}.pickle")
+
+        self.filename = filename
+        # The results loaded from an earlier run
+        self.done = {}
+
+        if resume and os.path.exists(filename):
+            self._load(header)
+            self.file = open(filename, "ab")
+            return
+
+        self.file = open(filename, "wb")
+        self._write(header)
+
+    def _load(self, header):
+        with open(self.filename, "rb") as f:
+            try:
+                found = pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                found = None
+            if found != header:
+                raise ValueError(
+                    f"{self.filename}: journal is from a different command"
+                )
+
+            good = f.tell()
+            while True:
+                try:
+                    key, result = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    break
+                self.done[key] = result
+                good = f.tell()
+
+        # Drop any partly written record, so appending can continue
+        with open(self.filename, "r+b") as f:
+            f.truncate(good)
+
+    def _write(self, record):
+        pickle.dump(record, self.file)
+        self.file.flush()
+
+    def __contains__(self, key):
+        """Is there a result for the key from the earlier run?"""
+        return key in self.done
+
+    def get(self, key):
+        """Return a result loaded from the earlier run"""
+        return self.done[key]
+
+    def record(self, key, result):
+        self._write((key, result))
+
+    def finish(self):
+        """The run is complete, so the journal is no longer needed"""
+        self.file.close()
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            # Already tidied up by another run of the same command
+            pass
@@ -0,0 +1,105 @@
+"""
+A registry of the csv fields seen for each datatype.
+
+Knowing the fields up front allows the csv header to be written before any
+rows, so the rows can be streamed out in one pass instead of first reading
+every row to find all the field names.
+
+The fields for a datatype come from (in order of preference):
+- the fields selected with --fields
+- the fields recorded in the registry file by previous runs
+- the fields in the botocore output shape for the handler
+
+If any field not in the header turns up in a row, it is written as json
+into the EXTRA_FIELD column, and recorded so that the next run will give
+it a column of its own.  If the fields for any datatype are not known at
+all, the caller falls back to reading every row first.
+"""
+
+import json
+import os
+
+
+# The metadata columns added to every csv row
+META_FIELDS = {"@DataType", "@MetaData", "@ResourceId"}
+
+# The column holding any fields that were not in the header
+EXTRA_FIELD = "@Extra"
+
+
+class Registry:
+    """Record the known csv fields for each datatype"""
+    def __init__(self, filename=None):
+        self.filename = filename
+        self._db = {
+            "fields": {},
+            "flatten": {},
+        }
+        self._changed = False
+
+        if filename is not None and os.path.exists(filename):
+            with open(filename) as f:
+                self._db.update(json.load(f))
+
+    def _section(self, flatten):
+        if flatten:
+            return self._db["flatten"]
+        return self._db["fields"]
+
+    def fields(self, datatype, flatten=False):
+        """Return the recorded fields for the datatype, or None"""
+        known = self._section(flatten).get(datatype)
+        if known is None:
+            return None
+        return set(known)
+
+    def record(self, datatype, fields, flatten=False):
+        """Add to the recorded fields for the datatype"""
+        section = self._section(flatten)
+        if datatype not in section:
+            section[datatype] = []
+            self._changed = True
+        known = section[datatype]
+        new = set(fields).difference(known)
+        if new:
+            known += sorted(new)
+            self._changed = True
+
+    def csv_fields(self, schemas, flatten=False, selected=None):
+        """Return all the csv fields for the given datatypes, or None if
+        any of them are unknown.
+
+        schemas is a dict mapping each datatype to the fields from its
+        botocore output shape (or None)"""
+        fields = set()
+        for datatype, model_fields in schemas.items():
+            known = None
+            if selected and not flatten:
+                known = set(selected)
+            if known is None:
+                known = self.fields(datatype, flatten)
+            if known is None and not flatten:
+                # The shape only knows the unflattened names
+                known = model_fields
+            if known is None:
+                return None
+            fields.update(known)
+
+        if not flatten:
+            fields.update(META_FIELDS)
+        return fields
+
+    def save(self):
+        if self.filename is None or not self._changed:
+            return
+
+        dirname = os.path.dirname(self.filename)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+        # Write and rename, so a failed run cannot leave a broken registry
+        tmpname = self.filename + ".tmp"
+        with open(tmpname, "w") as f:
+            json.dump(self._db, f, indent=1, sort_keys=True)
+        os.replace(tmpname, self.filename)
+        self._changed = False
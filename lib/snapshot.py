@@ -0,0 +1,341 @@
+"""
+Helpers to write and read the stored snapshot of cloud objects.
+
+The "files" snapshot is a directory hierachy with one yaml file per
+resource, laid out as datatype/profile/region/resourceid.yaml
+
+When a single datatype/profile/region has very many resources, the files
+can optionally be sharded into hash-prefix subdirectories, giving
+datatype/profile/region/@xx/resourceid.yaml - the readers here understand
+both layouts transparently.
+
+The "pack" snapshot is a single file containing the same items.  Each
+datatype/profile/region is stored as a separately compressed frame of JSON
+Lines, followed by an index of the frames.  This allows a reader to seek
+directly to the datatypes it wants without decompressing the rest.
+
+The files layout can also be written directly into a git branch, using
+git fast-import, without touching any working tree.
+
+Both kinds of snapshot can optionally be compressed with gzip or zstd (the
+latter needs the zstandard module), and are read back transparently.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+import yaml
+
+
+PACK_MAGIC = b"VICLOUDPACK1\n"
+
+# The footer is the offset and length of the index, followed by the magic
+PACK_FOOTER = struct.Struct(">QQ")
+
+# The filename suffix added for each compression type
+COMPRESS_SUFFIX = {
+    None: "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+FILES_SUFFIXES = tuple(".yaml" + i for i in COMPRESS_SUFFIX.values())
+
+
+def _zstandard():
+    """Import the optional zstd module only when it is needed"""
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression needs the zstandard module")
+    return zstandard
+
+
+def compress_bytes(raw, compress):
+    if compress == "gzip":
+        return gzip.compress(raw)
+    if compress == "zstd":
+        return _zstandard().ZstdCompressor().compress(raw)
+    raise ValueError(f"unknown compression {compress}")
+
+
+def decompress_bytes(raw, compress):
+    if compress == "gzip":
+        return gzip.decompress(raw)
+    if compress == "zstd":
+        return _zstandard().ZstdDecompressor().decompress(raw)
+    raise ValueError(f"unknown compression {compress}")
+
+
+def wrap_write(file, compress):
+    """Given a binary file, return a text file that compresses into it.
+    Closing the returned file does not close the underlying file"""
+    if compress == "gzip":
+        writer = gzip.GzipFile(fileobj=file, mode="wb")
+    elif compress == "zstd":
+        writer = _zstandard().ZstdCompressor().stream_writer(
+            file,
+            closefd=False,
+        )
+    else:
+        raise ValueError(f"unknown compression {compress}")
+    return io.TextIOWrapper(writer, encoding="utf8")
+
+
+def open_write(filename, compress=None):
+    """Open a text file for writing, with optional compression"""
+    if compress is None:
+        return open(filename, mode="w")
+    if compress == "gzip":
+        return gzip.open(filename, mode="wt", encoding="utf8")
+    if compress == "zstd":
+        return _zstandard().open(filename, mode="wt", encoding="utf8")
+    raise ValueError(f"unknown compression {compress}")
+
+
+def open_read(filename):
+    """Open a possibly compressed text file for reading"""
+    if filename.endswith(COMPRESS_SUFFIX["gzip"]):
+        return gzip.open(filename, mode="rt", encoding="utf8")
+    if filename.endswith(COMPRESS_SUFFIX["zstd"]):
+        return _zstandard().open(filename, mode="rt", encoding="utf8")
+    return open(filename, mode="r")
+
+
+# Prefix used to mark shard directories, chosen so that it does not collide
+# with any of the resource id path components
+SHARD_PREFIX = "@"
+
+
+def shard_name(resourceid):
+    """Return the shard directory name to use for the given resource id"""
+    digest = hashlib.sha1(str(resourceid).encode("utf8")).hexdigest()
+    return SHARD_PREFIX + digest[:2]
+
+
+def files_basedir(item):
+    """Return the directory components that hold all the resources of the
+    same datatype, profile and region as this item"""
+    return [
+        *item["datatype"].split("."),
+        item["metadata"]["profile"],
+        item["metadata"]["region"],
+    ]
+
+
+def files_path_components(item, shard=False):
+    """Return the path components for storing this item"""
+    resourceid = item["metadata"]["resourceid"]
+
+    path_components = files_basedir(item)
+    if shard:
+        path_components.append(shard_name(resourceid))
+
+    # Warning, resourceid could contain "/" chars
+    path_components += str(resourceid).split("/")
+    return path_components
+
+
+def shard_wanted(definition, threshold):
+    """Should the resources from this definition be sharded?"""
+    if not threshold:
+        return False
+    return len(definition) > threshold
+
+
+def clean_dir(pathname):
+    """Remove all the existing contents of the dir"""
+    for entry in os.scandir(pathname):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+            continue
+        os.remove(entry.path)
+
+
+def walk_files(dirname, suffix=FILES_SUFFIXES):
+    """Yield the names of all the snapshot files under the given dir"""
+    # This is a lot cheaper than glob("**/*.yaml") on a large tree
+    for entry in os.scandir(dirname):
+        if entry.name.startswith("."):
+            # skip hidden files and dirs, including any .git dir
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk_files(entry.path, suffix)
+            continue
+        if entry.name.endswith(suffix):
+            yield entry.path
+
+
+def load_files(dirname):
+    """Yield every stored item from a files snapshot"""
+    for filename in walk_files(dirname):
+        with open_read(filename) as f:
+            yield yaml.safe_load(f)
+
+
+def pack_write(file, data, compress=None):
+    """Write a pack snapshot of the DefinitionSet to the binary file"""
+    # The pack is always compressed, default to the most portable choice
+    if compress is None:
+        compress = "gzip"
+
+    index = []
+
+    file.write(PACK_MAGIC)
+    offset = len(PACK_MAGIC)
+
+    for definition in data:
+        lines = []
+        for item in definition.canonical_data():
+            lines.append(json.dumps(item, sort_keys=True, default=str))
+
+        if not lines:
+            continue
+
+        frame = compress_bytes("\n".join(lines).encode("utf8"), compress)
+        file.write(frame)
+
+        metadata = definition.datasource.metadata()
+        index.append({
+            "datatype": definition.datatype,
+            "profile": metadata["profile"],
+            "region": metadata["region"],
+            "count": len(lines),
+            "compress": compress,
+            "offset": offset,
+            "length": len(frame),
+        })
+        offset += len(frame)
+
+    raw_index = gzip.compress(json.dumps(index).encode("utf8"))
+    file.write(raw_index)
+    file.write(PACK_FOOTER.pack(offset, len(raw_index)))
+    file.write(PACK_MAGIC)
+
+
+def is_pack(filename):
+    """Does the named file look like a pack snapshot?"""
+    if not os.path.isfile(filename):
+        return False
+    with open(filename, "rb") as f:
+        return f.read(len(PACK_MAGIC)) == PACK_MAGIC
+
+
+def pack_index(file):
+    """Return the list of frames stored in the open pack file"""
+    trailer = PACK_FOOTER.size + len(PACK_MAGIC)
+    file.seek(-trailer, os.SEEK_END)
+    footer = file.read(trailer)
+
+    if footer[PACK_FOOTER.size:] != PACK_MAGIC:
+        raise ValueError("Not a pack file, or truncated")
+
+    offset, length = PACK_FOOTER.unpack(footer[:PACK_FOOTER.size])
+    file.seek(offset)
+    return json.loads(gzip.decompress(file.read(length)))
+
+
+def load_pack(filename, datatypes=None):
+    """Yield the stored items from a pack snapshot, optionally only those
+    with the given datatypes"""
+    with open(filename, "rb") as f:
+        for frame in pack_index(f):
+            if datatypes and frame["datatype"] not in datatypes:
+                continue
+
+            f.seek(frame["offset"])
+            raw = decompress_bytes(
+                f.read(frame["length"]),
+                frame.get("compress", "gzip"),
+            )
+            for line in raw.decode("utf8").split("\n"):
+                yield json.loads(line)
+
+
+def load(pathname, datatypes=None):
+    """Yield the stored items from any kind of snapshot"""
+    if is_pack(pathname):
+        yield from load_pack(pathname, datatypes)
+        return
+
+    if not datatypes:
+        yield from load_files(pathname)
+        return
+
+    # The datatype forms the first few dirs in the hierachy, so we only need
+    # to look there
+    for datatype in datatypes:
+        dirname = os.path.join(pathname, *datatype.split("."))
+        if os.path.isdir(dirname):
+            yield from load_files(dirname)
+
+
+def _git_quote(path):
+    """Quote a pathname, if needed, for the git fast-import stream"""
+    if not any(c in path for c in '"\\\n') and not path.startswith('"'):
+        return path
+    path = path.replace("\\", "\\\\")
+    path = path.replace('"', '\\"')
+    path = path.replace("\n", "\\n")
+    return f'"{path}"'
+
+
+def _git_data(file, raw):
+    file.write(f"data {len(raw)}\n".encode("utf8"))
+    file.write(raw)
+    file.write(b"\n")
+
+
+def git_write(file, data, branch, committer, message, parent=None,
+              shard_threshold=0):
+    """Write a git fast-import stream to the binary file, committing the
+    files layout of the DefinitionSet onto the given branch.
+
+    Only the datatype/profile/region dirs present in the data are replaced,
+    anything else in the parent commit is left untouched.  If reading the
+    data fails, the stream is left without its "done" command, so that
+    fast-import does not update the branch."""
+
+    file.write(b"feature done\n")
+    file.write(f"commit {branch}\n".encode("utf8"))
+    file.write(f"committer {committer}\n".encode("utf8"))
+    _git_data(file, message.encode("utf8"))
+    if parent is not None:
+        file.write(f"from {parent}\n".encode("utf8"))
+
+    # track which dirs we have seen
+    seen_paths = set()
+
+    for definition in data:
+        shard = shard_wanted(definition, shard_threshold)
+
+        for item in definition.canonical_data():
+            basedir = "/".join(files_basedir(item))
+            path_components = files_path_components(item, shard)
+            filename = "/".join(path_components) + ".yaml"
+
+            if basedir not in seen_paths:
+                # Remove any stale old data
+                file.write(f"D {_git_quote(basedir)}\n".encode("utf8"))
+                seen_paths.add(basedir)
+
+            yamlstr = yaml.safe_dump(
+                item,
+                explicit_start=True,
+                explicit_end=True,
+                default_flow_style=False,
+                sort_keys=True,
+            )
+
+            file.write(f"M 100644 inline {_git_quote(filename)}\n".encode(
+                "utf8"
+            ))
+            # match the trailing newline added by the files output
+            _git_data(file, (yamlstr + "\n").encode("utf8"))
+
+    file.write(b"\n")
+    file.write(b"done\n")
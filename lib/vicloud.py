@@ -1,4 +1,82 @@
+import contextlib
+import fcntl
+import hashlib
 import json
+import os
+import time
+
+
+def cache_filename(name):
+    """Return the pathname for the named cache file"""
+    dirname = os.environ.get("XDG_CACHE_HOME")
+    if not dirname:
+        dirname = os.path.expanduser("~/.cache")
+    dirname = os.path.join(dirname, "vicloud")
+    os.makedirs(dirname, exist_ok=True)
+    return os.path.join(dirname, name)
+
+
+def cache_load(name, ttl=None):
+    """Load a dict from the named cache file, dropping any entries that were
+    stored more than ttl seconds ago"""
+    try:
+        with open(cache_filename(name)) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if ttl is None:
+        return data
+
+    now = time.time()
+    result = {}
+    for k, entry in data.items():
+        if now - entry.get("time", 0) > ttl:
+            continue
+        result[k] = entry
+    return result
+
+
+def cache_save(name, data):
+    """Save a dict to the named cache file"""
+    filename = cache_filename(name)
+
+    # Write and rename, so that a concurrent reader never sees a partial file
+    tmpname = f"{filename}.{os.getpid()}.tmp"
+    with open(tmpname, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmpname, filename)
+
+
+@contextlib.contextmanager
+def cache_lock(name):
+    """Hold an exclusive lock, shared with any other processes, while
+    updating the named cache entry.  The lock file is removed again when
+    the lock is released, so they do not pile up"""
+    digest = hashlib.sha1(name.encode("utf8")).hexdigest()
+    filename = cache_filename(f"lock.{digest}")
+    while True:
+        f = open(filename, "a")
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+        # The previous holder may have removed the file while we waited, in
+        # which case our lock is on a file nobody else can find any more
+        try:
+            held = os.fstat(f.fileno())
+            current = os.stat(filename)
+        except FileNotFoundError:
+            current = None
+        if current is not None and os.path.samestat(held, current):
+            break
+        f.close()
+
+    try:
+        yield
+    finally:
+        # Remove it before unlocking, so the next holder has to create it
+        # again
+        os.unlink(filename)
+        f.close()
 
 
 class DataSource:
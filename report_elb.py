@@ -5,10 +5,20 @@
 #
 
 import argparse
-import glob
 import os
+import sys
 import yaml
 
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
+)
+
+import snapshot     # noqa
+
 
 def argparser():
     args = argparse.ArgumentParser(
@@ -45,7 +55,7 @@ def argparser():
 
     args.add_argument(
         "dirname",
-        help="Which directory to scan for SGR items",
+        help="Which directory (or pack file) to scan for SGR items",
     )
 
     r = args.parse_args()
@@ -540,41 +550,47 @@ def load_cloudflare_yaml(files):
 
 
 def load_data(args):
-    os.chdir(args.dirname)
-    for filename in glob.glob("**/*.yaml", recursive=True):
-        with open(filename, "r+") as f:
-            raw = yaml.safe_load(f)
-            if args.profile and raw["metadata"]["profile"] not in args.profile:
-                continue
-            if args.region and raw["metadata"]["region"] not in args.region:
-                continue
-
-            datatype = raw["datatype"]
-            item = raw["specifics"]
-
-            if datatype == "aws.elbv2.load_balancers":
-                Load_Balancer(item)
-                continue
-
-            if datatype == "aws.elbv2.listeners":
-                Listener(item)
-                continue
-
-            if datatype == "aws.elbv2.target_groups":
-                Target_Group(item)
-                continue
-
-            if datatype == "aws.elbv2.target_health":
-                Target_Health(item)
-                continue
-
-            if datatype == "aws.elbv2.rules":
-                Rules(item)
-                continue
-
-            if datatype == "aws.ec2.instances":
-                Instance(item)
-                continue
+    datatypes = [
+        "aws.elbv2.load_balancers",
+        "aws.elbv2.listeners",
+        "aws.elbv2.target_groups",
+        "aws.elbv2.target_health",
+        "aws.elbv2.rules",
+        "aws.ec2.instances",
+    ]
+
+    for raw in snapshot.load(args.dirname, datatypes):
+        if args.profile and raw["metadata"]["profile"] not in args.profile:
+            continue
+        if args.region and raw["metadata"]["region"] not in args.region:
+            continue
+
+        datatype = raw["datatype"]
+        item = raw["specifics"]
+
+        if datatype == "aws.elbv2.load_balancers":
+            Load_Balancer(item)
+            continue
+
+        if datatype == "aws.elbv2.listeners":
+            Listener(item)
+            continue
+
+        if datatype == "aws.elbv2.target_groups":
+            Target_Group(item)
+            continue
+
+        if datatype == "aws.elbv2.target_health":
+            Target_Health(item)
+            continue
+
+        if datatype == "aws.elbv2.rules":
+            Rules(item)
+            continue
+
+        if datatype == "aws.ec2.instances":
+            Instance(item)
+            continue
 
 
 def main():
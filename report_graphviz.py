@@ -2,8 +2,19 @@
 """Draw a connection diagram for dumped data"""
 #
 
-import glob
+import os
 import re
+import sys
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
+)
+
+import snapshot     # noqa
 
 
 def read_ids(f):
@@ -48,8 +59,8 @@ def main():
     print(" node [ shape = rectangle ]")
     print(" rankdir = LR")
 
-    for filename in glob.glob("**/*.yaml", recursive=True):
-        with open(filename, "r+") as f:
+    for filename in snapshot.walk_files("."):
+        with snapshot.open_read(filename) as f:
             read_ids(f)
 
     print("}")
@@ -4,9 +4,18 @@
 #
 
 import argparse
-import glob
 import os
-import yaml
+import sys
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
+)
+
+import snapshot     # noqa
 
 
 def argparser():
@@ -29,7 +38,7 @@ def argparser():
 
     args.add_argument(
         "dirname",
-        help="Which directory to scan for data files",
+        help="Which directory (or pack file) to scan for data files",
     )
 
     r = args.parse_args()
@@ -117,22 +126,19 @@ def load_data(args):
         "aws.ec2.vpcs": data_add_vpc,
     }
 
-    os.chdir(args.dirname)
-    for filename in glob.glob("**/*.yaml", recursive=True):
-        with open(filename, "r+") as f:
-            raw = yaml.safe_load(f)
-            if args.profile and raw["metadata"]["profile"] not in args.profile:
-                continue
-            if args.region and raw["metadata"]["region"] not in args.region:
-                continue
-
-            datatype = raw["datatype"]
-            _id = raw["metadata"]["resourceid"]
-            item = raw["specifics"]
-
-            if datatype in loaders:
-                loaders[datatype](_id, item)
-                continue
+    for raw in snapshot.load(args.dirname, loaders.keys()):
+        if args.profile and raw["metadata"]["profile"] not in args.profile:
+            continue
+        if args.region and raw["metadata"]["region"] not in args.region:
+            continue
+
+        datatype = raw["datatype"]
+        _id = raw["metadata"]["resourceid"]
+        item = raw["specifics"]
+
+        if datatype in loaders:
+            loaders[datatype](_id, item)
+            continue
 
 
 def dump_graphviz():
@@ -5,10 +5,19 @@
 
 import argparse
 import collections
-import glob
 import os
 import socket
-import yaml
+import sys
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
+)
+
+import snapshot     # noqa
 
 
 def port2sortable(s):
@@ -58,7 +67,7 @@ def argparser():
 
     args.add_argument(
         "dirname",
-        help="Which directory to scan for data files",
+        help="Which directory (or pack file) to scan for data files",
     )
 
     r = args.parse_args()
@@ -216,27 +225,30 @@ def dump_all_ipaddrs():
 
 
 def load_data(args):
-    os.chdir(args.dirname)
-    for filename in glob.glob("**/*.yaml", recursive=True):
-        with open(filename, "r+") as f:
-            raw = yaml.safe_load(f)
-            if args.profile and raw["metadata"]["profile"] not in args.profile:
-                continue
-            if args.region and raw["metadata"]["region"] not in args.region:
-                continue
-
-            _id = raw["metadata"]["resourceid"]
-            item = raw["specifics"]
-
-            if raw["datatype"] == "aws.ec2.instances":
-                data_add_instance(_id, item)
-                continue
-            if raw["datatype"] == "aws.ec2.network_interfaces":
-                data_add_network_interface(_id, item)
-                continue
-            if raw["datatype"] == "aws.ec2.subnets":
-                data_add_subnet(_id, item)
-                continue
+    datatypes = [
+        "aws.ec2.instances",
+        "aws.ec2.network_interfaces",
+        "aws.ec2.subnets",
+    ]
+
+    for raw in snapshot.load(args.dirname, datatypes):
+        if args.profile and raw["metadata"]["profile"] not in args.profile:
+            continue
+        if args.region and raw["metadata"]["region"] not in args.region:
+            continue
+
+        _id = raw["metadata"]["resourceid"]
+        item = raw["specifics"]
+
+        if raw["datatype"] == "aws.ec2.instances":
+            data_add_instance(_id, item)
+            continue
+        if raw["datatype"] == "aws.ec2.network_interfaces":
+            data_add_network_interface(_id, item)
+            continue
+        if raw["datatype"] == "aws.ec2.subnets":
+            data_add_subnet(_id, item)
+            continue
 
 
 def main():
@@ -7,10 +7,19 @@
 import argparse
 import collections
 import ctypes
-import glob
 import os
 import socket
-import yaml
+import sys
+
+# Ensure that we look for any modules in our local lib dir.  This allows simple
+# testing and development use.  It also does not break the case where the lib
+# has been installed properly on the normal sys.path
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lib')
+)
+
+import snapshot     # noqa
 
 
 # FFS, python, what happened to "batteries included"?
@@ -70,7 +79,7 @@ def argparser():
 
     args.add_argument(
         "dirname",
-        help="Which directory to scan for SGR items",
+        help="Which directory (or pack file) to scan for SGR items",
     )
 
     r = args.parse_args()
@@ -402,36 +411,42 @@ def dump_all_sg():
 
 
 def load_data(args):
-    os.chdir(args.dirname)
-    for filename in glob.glob("**/*.yaml", recursive=True):
-        with open(filename, "r+") as f:
-            raw = yaml.safe_load(f)
-            if args.profile and raw["metadata"]["profile"] not in args.profile:
-                continue
-            if args.region and raw["metadata"]["region"] not in args.region:
-                continue
-
-            _id = raw["metadata"]["resourceid"]
-            item = raw["specifics"]
-
-            if raw["datatype"] == "aws.ec2.instances":
-                data_add_instance(_id, item)
-                continue
-            if raw["datatype"] == "aws.ec2.network_acls":
-                data_add_acl(_id, item)
-                continue
-            if raw["datatype"] == "aws.ec2.security_group_rules":
-                data_add_sgr(_id, item)
-                continue
-            if raw["datatype"] == "aws.ec2.security_groups":
-                data_add_sg(_id, item)
-                continue
-            if raw["datatype"] == "aws.ec2.vpcs":
-                data_add_vpc(_id, item)
-                continue
-            if raw["datatype"] == "aws.elbv2.load_balancers":
-                data_add_elb(_id, item)
-                continue
+    datatypes = [
+        "aws.ec2.instances",
+        "aws.ec2.network_acls",
+        "aws.ec2.security_group_rules",
+        "aws.ec2.security_groups",
+        "aws.ec2.vpcs",
+        "aws.elbv2.load_balancers",
+    ]
+
+    for raw in snapshot.load(args.dirname, datatypes):
+        if args.profile and raw["metadata"]["profile"] not in args.profile:
+            continue
+        if args.region and raw["metadata"]["region"] not in args.region:
+            continue
+
+        _id = raw["metadata"]["resourceid"]
+        item = raw["specifics"]
+
+        if raw["datatype"] == "aws.ec2.instances":
+            data_add_instance(_id, item)
+            continue
+        if raw["datatype"] == "aws.ec2.network_acls":
+            data_add_acl(_id, item)
+            continue
+        if raw["datatype"] == "aws.ec2.security_group_rules":
+            data_add_sgr(_id, item)
+            continue
+        if raw["datatype"] == "aws.ec2.security_groups":
+            data_add_sg(_id, item)
+            continue
+        if raw["datatype"] == "aws.ec2.vpcs":
+            data_add_vpc(_id, item)
+            continue
+        if raw["datatype"] == "aws.elbv2.load_balancers":
+            data_add_elb(_id, item)
+            continue
 
 
 def main():
@@ -0,0 +1,113 @@
+"""
+A fetch that fails part way must not replace an existing snapshot
+"""
+
+import argparse
+import importlib.util
+import os
+import subprocess
+import tempfile
+import unittest
+
+TOPDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# The command is a script, not a module, so load it by its filename
+_spec = importlib.util.spec_from_file_location(
+    "vicloud_main",
+    os.path.join(TOPDIR, "vicloud.py"),
+)
+vicloud_main = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(vicloud_main)
+
+import definitionset    # noqa
+import snapshot         # noqa
+import vicloud          # noqa
+
+
+class FakeDataSource(vicloud.DataSource):
+    def __init__(self, region):
+        self.region = region
+
+    def metadata(self):
+        return {"profile": "p", "region": self.region}
+
+
+def definition(region):
+    this = definitionset.Definition()
+    this.datasource = FakeDataSource(region)
+    this.datatype = "aws.test.things"
+    this.data = {f"id-{region}": {"Name": region}}
+    return this
+
+
+class FakeHandler:
+    """Fetch one definition for each region, then optionally fail"""
+    def __init__(self, regions, fail):
+        self.regions = regions
+        self.fail = fail
+
+    def fetch_iter(self):
+        for region in self.regions:
+            yield definition(region)
+        if self.fail:
+            raise RuntimeError("fetch failed")
+
+    def fetch(self, args, sessions):
+        return definitionset.DefinitionSet(self.fetch_iter())
+
+
+class TestAbort(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.git_dir = os.path.join(self.tmp.name, "repo")
+        self.pack_file = os.path.join(self.tmp.name, "snapshot.pack")
+        subprocess.run(
+            ["git", "init", "--quiet", self.git_dir],
+            check=True,
+        )
+
+        os.environ["GIT_COMMITTER_NAME"] = "test"
+        os.environ["GIT_COMMITTER_EMAIL"] = "test@example.com"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def args(self):
+        return argparse.Namespace(
+            command="dump",
+            compress=None,
+            git_branch="snapshot",
+            shard_threshold=0,
+            verbose=0,
+            mode=[("git", self.git_dir), ("pack", self.pack_file)],
+        )
+
+    def branch(self):
+        return subprocess.run(
+            ["git", "rev-parse", "--verify", "--quiet", "refs/heads/snapshot"],
+            cwd=self.git_dir,
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout.strip()
+
+    def pack_regions(self):
+        items = snapshot.load_pack(self.pack_file)
+        return sorted(item["metadata"]["region"] for item in items)
+
+    def test_failed_fetch_keeps_snapshot(self):
+        args = self.args()
+        vicloud_main.process_data(args, FakeHandler(["r1", "r2"], False), [])
+        commit = self.branch()
+        self.assertTrue(commit)
+        self.assertEqual(self.pack_regions(), ["r1", "r2"])
+
+        with self.assertRaises(RuntimeError):
+            vicloud_main.process_data(args, FakeHandler(["r3"], True), [])
+
+        self.assertEqual(self.branch(), commit)
+        self.assertEqual(self.pack_regions(), ["r1", "r2"])
+        self.assertFalse(os.path.exists(self.pack_file + ".tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
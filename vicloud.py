@@ -11,12 +11,15 @@
 # ...
 
 import argparse
+import contextlib
 import csv
 import inspect
 import json
 import os
+import queue
 import subprocess
 import sys
+import threading
 import yaml
 
 # Ensure that we look for any modules in our local lib dir.  This allows simple
@@ -39,52 +42,97 @@ import aws.rds          # noqa
 import aws.route53      # noqa
 import aws.ssm          # noqa
 import definitionset    # noqa
+import flatten          # noqa
+import journal          # noqa
+import schema           # noqa
+import snapshot         # noqa
+
+
+def output_data_csv(args, data, file):
+    def rows():
+        for row in data.csv_rows():
+            if args.flatten:
+                row = flatten.flatten(row)
+            yield row
+
+    # If we already know all the fields, the header can be written straight
+    # away and the rows streamed in one pass
+    registry = None
+    fields = None
+    if args.schema_file:
+        registry = schema.Registry(args.schema_file)
+        schemas = args.handler.schemas()
+        fields = registry.csv_fields(
+            schemas,
+            flatten=args.flatten,
+            selected=args.fields,
+        )
 
-
-def output_data_csv(args, handler, sessions, file):
-    data = handler.fetch(args, sessions)
-    if data is None:
-        print("No data")
-        return
-    if args.verbose > 1:
-        print(data)
-
-    fields = sorted(data.csv_fields())
-    writer = csv.DictWriter(file, fieldnames=fields)
+    header = None
+    if fields is not None:
+        header = sorted(fields) + [schema.EXTRA_FIELD]
+        all_rows = rows()
+    else:
+        # Otherwise the header needs the fields from every row, so the
+        # (flattened) rows must be collected first
+        all_rows = []
+        fields = set()
+        for row in rows():
+            fields.update(row)
+            all_rows.append(row)
+        header = sorted(fields)
+
+    writer = csv.DictWriter(file, fieldnames=header)
     writer.writeheader()
-    for row in data.csv_rows():
-        writer.writerow(row)
+    for row in all_rows:
+        if registry is not None:
+            registry.record(row["@DataType"], row, args.flatten)
+
+        extra = {}
+        for k in row.keys() - fields:
+            extra[k] = row.pop(k)
+        if extra:
+            row[schema.EXTRA_FIELD] = json.dumps(
+                extra,
+                sort_keys=True,
+                default=str,
+            )
 
+        writer.writerow(row)
 
-def output_data_json(args, handler, sessions, file):
-    data = handler.fetch(args, sessions)
-    if data is None:
-        print("No data")
-        return
-    if args.verbose > 1:
-        print(data)
-
-    output = []
-    for row in data.csv_rows():
-        output.append(row)
-    json.dump(
-        output,
-        file,
-        sort_keys=True,
-        default=str,
-    )
+    if registry is not None:
+        # Any datatype without rows is known to have no fields, so that it
+        # cannot stop the next run from writing in one pass
+        for datatype in schemas:
+            registry.record(datatype, (), args.flatten)
+        registry.save()
+
+
+def output_data_json(args, data, file):
+    # Write the list one row at a time, to avoid holding it all
+    file.write("[")
+    for n, row in enumerate(data.csv_rows()):
+        if n:
+            file.write(", ")
+        json.dump(
+            row,
+            file,
+            sort_keys=True,
+            default=str,
+        )
+    file.write("]")
 
 
-def output_data_vd(args, handler, sessions, mode):
+def output_data_vd(args, data, mode):
     child = subprocess.Popen(
         ["vd", "-f", mode, "-"],
         stdin=subprocess.PIPE,
         text=True
     )
     if mode == "csv":
-        output_data_csv(args, handler, sessions, child.stdin)
+        output_data_csv(args, data, child.stdin)
     elif mode == "json":
-        output_data_json(args, handler, sessions, child.stdin)
+        output_data_json(args, data, child.stdin)
     else:
         raise ValueError(f"unknown vd mode {mode}")
 
@@ -92,18 +140,10 @@ def output_data_vd(args, handler, sessions, mode):
     child.wait()
 
 
-def output_data_yaml(args, handler, sessions, file):
+def output_data_yaml(args, data, file):
     # TODO:
-    # - use an accessor for the DefinitionSet list
     # - use an accessor for the Definition data
 
-    data = handler.fetch(args, sessions)
-    if data is None:
-        print("No data")
-        return
-    if args.verbose > 1:
-        print(data)
-
     for item in data.canonical_data():
         yamlstr = yaml.safe_dump(
             item,
@@ -112,84 +152,270 @@ def output_data_yaml(args, handler, sessions, file):
             sort_keys=True,
         )
         print(yamlstr, file=file, end="")
-    print("...")
+    print("...", file=file)
 
 
-def output_files_yaml(args, handler, sessions, verbose):
+def output_files_yaml(args, data, dirname):
     """Create a directory hierachy with one file per resource"""
 
-    data = handler.fetch(args, sessions)
-    if data is None:
-        print("No data")
-        return
-    if args.verbose > 1:
-        print(data)
-
     # track which dirs we have seen
     seen_paths = set()
 
-    for item in data.canonical_data():
+    for definition in data:
+        # Each definition holds all the resources for one datatype, profile
+        # and region, so decide on the directory layout for all of them
+        shard = snapshot.shard_wanted(definition, args.shard_threshold)
+
+        for item in definition.canonical_data():
+            basedir = os.path.join(dirname, *snapshot.files_basedir(item))
+            path_components = snapshot.files_path_components(item, shard)
+
+            pathname = os.path.join(dirname, *path_components[:-1])
+            filename = os.path.join(dirname, *path_components) + ".yaml"
+            filename += snapshot.COMPRESS_SUFFIX[args.compress]
+
+            yamlstr = yaml.safe_dump(
+                item,
+                explicit_start=True,
+                explicit_end=True,
+                default_flow_style=False,
+                sort_keys=True,
+            )
+
+            if basedir not in seen_paths:
+                # The first time we touch a directory, we first empty it of
+                # any existing files (this will remove stale old data, even
+                # if the layout has changed since the last run)
+                os.makedirs(basedir, exist_ok=True)
+                snapshot.clean_dir(basedir)
+                seen_paths.add(basedir)
+
+            os.makedirs(pathname, exist_ok=True)
+
+            print(filename)
+            with snapshot.open_write(filename, args.compress) as f:
+                print(yamlstr, file=f)
+
+
+def output_pack(args, data, filename):
+    """Create a single file with all the resources"""
+    # Write and rename, so a failed run leaves any previous pack in place
+    tmpname = filename + ".tmp"
+    try:
+        with open(tmpname, mode="wb") as f:
+            snapshot.pack_write(f, data, args.compress)
+    except BaseException:
+        os.remove(tmpname)
+        raise
+    os.replace(tmpname, filename)
+
+
+def output_git(args, data, git_dir):
+    """Commit the files hierachy directly into a git branch"""
+
+    def git(*cmd, check=True, **kwargs):
+        return subprocess.run(
+            ["git", *cmd],
+            cwd=git_dir,
+            check=check,
+            **kwargs,
+        )
 
-        # Warning, resourceid could contain "/" chars
-        path_components = [
-            *item["datatype"].split("."),
-            item["metadata"]["profile"],
-            item["metadata"]["region"],
-            *(str(item["metadata"]["resourceid"]).split("/")),
-        ]
+    branch = args.git_branch
+    if not branch.startswith("refs/"):
+        branch = "refs/heads/" + branch
 
-        pathname = os.path.join(*path_components[:-1])
-        filename = os.path.join(*path_components) + ".yaml"
+    exists = git(
+        "rev-parse", "--verify", "--quiet", branch,
+        stdout=subprocess.DEVNULL,
+        check=False,
+    )
+    parent = None
+    if exists.returncode == 0:
+        parent = branch + "^0"
 
-        yamlstr = yaml.safe_dump(
-            item,
-            explicit_start=True,
-            explicit_end=True,
-            default_flow_style=False,
-            sort_keys=True,
+    committer = git(
+        "var", "GIT_COMMITTER_IDENT",
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout.strip()
+
+    child = subprocess.Popen(
+        ["git", "fast-import", "--quiet"],
+        cwd=git_dir,
+        stdin=subprocess.PIPE,
+    )
+    try:
+        snapshot.git_write(
+            child.stdin,
+            data,
+            branch,
+            committer,
+            f"vicloud {args.command} snapshot\n",
+            parent=parent,
+            shard_threshold=args.shard_threshold,
         )
+    except BaseException:
+        # Without its "done", fast-import gives up without updating the
+        # branch
+        child.stdin.close()
+        child.wait()
+        raise
+    child.stdin.close()
+    if child.wait():
+        raise ValueError("git fast-import failed")
 
-        os.makedirs(pathname, exist_ok=True)
+    if args.verbose:
+        print(f"Committed to {branch}", file=sys.stderr)
 
-        if pathname not in seen_paths:
-            # The first time we touch a directory, we first empty it of any
-            # existing files (this will remove stale old data)
-            for name in os.listdir(pathname):
-                os.remove(os.path.join(pathname, name))
 
-        seen_paths.add(pathname)
+@contextlib.contextmanager
+def open_output(filename, compress=None):
+    """Open the named output file, or use stdout if no name is given"""
+    if filename is not None:
+        with snapshot.open_write(filename, compress) as f:
+            yield f
+        return
 
-        print(filename)
-        with open(filename, mode="w") as f:
-            print(yamlstr, file=f)
+    if compress is None:
+        yield sys.stdout
+        return
 
+    sys.stdout.flush()
+    f = snapshot.wrap_write(sys.stdout.buffer, compress)
+    try:
+        yield f
+    finally:
+        f.close()
 
-def process_data(args, handler, sessions):
-    # TODO:
-    # if show table ..
-    # if edit ..
-    # output file name
 
-    if args.mode == "csv":
-        output_data_csv(args, handler, sessions, sys.stdout)
+output_modes = [
+    "csv",
+    "files",
+    "git",
+    "json",
+    "pack",
+    "vd",
+    "yaml",
+]
+
+
+def output(args, data, mode, target):
+    """Send the data to one output"""
+    if mode == "csv":
+        with open_output(target) as file:
+            output_data_csv(args, data, file)
+        return
+
+    if mode == "files":
+        output_files_yaml(args, data, target or ".")
+        return
+
+    if mode == "json":
+        with open_output(target, args.compress) as file:
+            output_data_json(args, data, file)
+        return
+
+    if mode == "git":
+        output_git(args, data, target or args.git_dir)
+        return
+
+    if mode == "pack":
+        output_pack(args, data, target or args.pack_file)
         return
 
-    if args.mode == "files":
-        output_files_yaml(args, handler, sessions, args.verbose)
+    if mode == "vd":
+        output_data_vd(args, data, target or args.mode_vd)
         return
 
-    if args.mode == "json":
-        output_data_json(args, handler, sessions, sys.stdout)
+    if mode == "yaml":
+        with open_output(target) as file:
+            output_data_yaml(args, data, file)
         return
 
-    if args.mode == "vd":
-        output_data_vd(args, handler, sessions, args.mode_vd)
+    raise ValueError(f"unknown mode {mode}")
+
+
+class FetchAborted(Exception):
+    """The fetch failed part way, so the output should not be completed"""
+
+
+# Sent to the output threads, instead of the None that ends the stream, when
+# the fetch fails
+_ABORT = object()
+
+
+def _output_thread(args, q, mode, target, errors):
+    """Run one output, reading its stream of definitions from the queue"""
+    def source():
+        while True:
+            definition = q.get()
+            if definition is None:
+                return
+            if definition is _ABORT:
+                raise FetchAborted("fetch failed")
+            yield definition
+
+    stream = source()
+    try:
+        output(args, definitionset.DefinitionSet(stream), mode, target)
+    except Exception as e:
+        errors.append(e)
+
+    # Ensure that the queue is drained, even if the output failed, so that
+    # the fetch can never block on it
+    for _ in stream:
+        pass
+
+
+def process_data(args, handler, sessions):
+    # TODO:
+    # if show table ..
+    # if edit ..
+
+    # Fetch once, and then feed the same data to every output
+    data = handler.fetch(args, sessions)
+    if data is None:
+        print("No data")
         return
+    if args.verbose > 1:
+        print(data)
 
-    if args.mode == "yaml":
-        output_data_yaml(args, handler, sessions, sys.stdout)
+    if not data.streaming or len(args.mode) == 1:
+        for mode, target in args.mode:
+            output(args, data, mode, target)
         return
 
+    # A stream can only be read once, so fan it out to every output, each
+    # running in its own thread with a small queue
+    queues = []
+    threads = []
+    errors = []
+    for mode, target in args.mode:
+        q = queue.Queue(maxsize=1)
+        thread = threading.Thread(
+            target=_output_thread,
+            args=(args, q, mode, target, errors),
+        )
+        thread.start()
+        queues.append(q)
+        threads.append(thread)
+
+    end = _ABORT
+    try:
+        for definition in data:
+            for q in queues:
+                q.put(definition)
+        end = None
+    finally:
+        for q in queues:
+            q.put(end)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
 
 class dumper:
     """Dump all the dumpable items from all the modules"""
@@ -197,34 +423,62 @@ class dumper:
     dump = False
 
     def fetch(self, args, sessions):
-        global subc_list
-
-        db = definitionset.DefinitionSet()
-
-        # TODO:
-        # just recurse the subc_list
+        db = definitionset.DefinitionSet(self.fetch_iter(args, sessions))
+        if not args.stream:
+            db.collect()
+        return db
 
+    @classmethod
+    def handlers(cls):
+        """Yield every handler class that should be dumped"""
         for major_name, major in subc_list.items():
             if "subc" not in major:
                 continue
             for minor_name, minor in major["subc"].items():
                 if "handler" not in minor:
                     continue
-                cls = minor["handler"]
-
-                handler = cls()
-                handler.verbose = args.verbose
-
+                handler = minor["handler"]
                 if not handler.dump:
                     continue
+                yield handler
+
+    @classmethod
+    def schemas(cls):
+        """Return the expected fields for each datatype we will fetch"""
+        result = {}
+        for handler in cls.handlers():
+            result.update(handler.schemas())
+        return result
 
-                data = handler.fetch(args, sessions)
+    def fetch_iter(self, args, sessions):
+        # TODO:
+        # just recurse the subc_list
 
-                if data:
-                    # TODO: use an accessor and not just grub around for _list
-                    db._list += data._list
+        # Spread every handler and session across any worker processes
+        parallel = aws.fetch_parallel(args, self.handlers(), sessions)
+        if parallel is not None:
+            yield from parallel
+            return
 
-        return db
+        handlers = list(self.handlers())
+        try:
+            for i, cls in enumerate(handlers):
+                handler = cls()
+                handler.verbose = args.verbose
+
+                # Each handler yields its definitions as they are fetched
+                yield from handler.fetch(args, sessions)
+
+                # Release the parent results that no later handler needs
+                later = set()
+                for other in handlers[i + 1:]:
+                    later.update(other.parent_classes())
+                for parent in cls.parent_classes():
+                    if parent not in later:
+                        aws.release_shared(parent)
+        finally:
+            # The parent results are only shared within this dump
+            aws.clear_shared()
 
 
 subc_list = {
@@ -294,6 +548,16 @@ def argparser_subc(argp, subc_list):
             argparser_subc(cmd, data["subc"])
 
 
+def mode_spec(value):
+    """Parse one --mode option into a (mode, target) tuple"""
+    mode, _, target = value.partition("=")
+    if mode not in output_modes:
+        raise argparse.ArgumentTypeError(f"unknown mode {mode}")
+    if not target:
+        target = None
+    return (mode, target)
+
+
 def argparser():
     args = argparse.ArgumentParser(
         description=__doc__,
@@ -305,12 +569,198 @@ def argparser():
         default=[],
         help="Select which awscli profile to use",
     )
+    args.add_argument(
+        "--dedupe_accounts",
+        action="store_true",
+        default=False,
+        help="Only use the first profile for each AWS account and principal"
+        " (user or role)",
+    )
+    args.add_argument(
+        "--organization",
+        action="store_true",
+        default=False,
+        help="Fetch from every account in the AWS Organization, by assuming"
+        " a role from the (first) --profile into each account",
+    )
+    args.add_argument(
+        "--organization_role",
+        default="OrganizationAccountAccessRole",
+        help="The role name to assume in each organization account",
+    )
     args.add_argument(
         "--region",
         action="append",
         default=[],
         help="Restrict queries to this region only (default is all regions)",
     )
+    args.add_argument(
+        "--fields",
+        action="append",
+        default=[],
+        help="Only keep these fields of each resource (default is all)",
+    )
+    args.add_argument(
+        "--where",
+        default=None,
+        help="Only keep resources that match this JMESPath expression,"
+        " eg: \"State.Name == 'running'\"",
+    )
+    args.add_argument(
+        "--compact",
+        action="store_true",
+        default=False,
+        help="Share repeated strings in the fetched data to reduce memory",
+    )
+    args.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Fetch using this many worker processes",
+    )
+    args.add_argument(
+        "--dag_workers",
+        type=int,
+        default=1,
+        help="Fetch using this many threads, running each handler after"
+        " its parents and the longest chains of handlers first",
+    )
+    args.add_argument(
+        "--coordinator",
+        default=None,
+        metavar="HOST:PORT",
+        help="Hand the fetching out to workers that connect to this address",
+    )
+    args.add_argument(
+        "--local_workers",
+        type=int,
+        default=0,
+        help="As a coordinator, also start this many local workers",
+    )
+    args.add_argument(
+        "--worker",
+        default=None,
+        metavar="HOST:PORT",
+        help="Run as a worker for the coordinator at this address",
+    )
+    args.add_argument(
+        "--authkey",
+        default=os.environ.get("VICLOUD_AUTHKEY"),
+        help="Shared secret for the coordinator and its workers"
+        " (default: $VICLOUD_AUTHKEY)",
+    )
+    args.add_argument(
+        "--shard_zones",
+        action="store_true",
+        default=False,
+        help="Split the large EC2 listings into one listing per availability"
+        " zone, fetched in parallel",
+    )
+    args.add_argument(
+        "--fast_json",
+        action="store_true",
+        default=False,
+        help="Use a faster parser for the json protocol services (eg: logs,"
+        " ecs, eks, ssm)",
+    )
+    args.add_argument(
+        "--prefetch_pages",
+        type=int,
+        default=aws.PREFETCH_PAGES,
+        help="How many pages to fetch ahead of the one being processed"
+        " (0 to disable)",
+    )
+    args.add_argument(
+        "--deadline",
+        type=float,
+        default=None,
+        help="Seconds to allow each call (or page) before trying it again",
+    )
+    args.add_argument(
+        "--deadline_attempts",
+        type=int,
+        default=3,
+        help="How many times to try a call that misses its deadline",
+    )
+    args.add_argument(
+        "--hedge_percentile",
+        type=float,
+        default=None,
+        help="Make a duplicate call when one is slower than this percentile"
+        " of the recent calls to the same operation, eg: 95",
+    )
+    args.add_argument(
+        "--handler_budget",
+        type=float,
+        default=None,
+        help="Seconds each handler may spend, before skipping any more"
+        " regions",
+    )
+    args.add_argument(
+        "--negative_ttl",
+        type=int,
+        default=aws.NEGATIVE_CACHE_TTL,
+        help="Seconds to remember the regions and operations that fail, so"
+        " they can be skipped (0 to disable)",
+    )
+    args.add_argument(
+        "--journal",
+        default=None,
+        help="Record each completed fetch in this file (default: one for"
+        " each command, in the cache dir)",
+    )
+    args.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Continue an interrupted run, using the results in its journal",
+    )
+    args.add_argument(
+        "--transport_file",
+        default=None,
+        help="YAML file of client transport settings, with optional"
+        " per-service overrides under a \"services\" key",
+    )
+    args.add_argument(
+        "--max_pool_connections",
+        type=int,
+        default=None,
+        help="Size of the connection pool for each client",
+    )
+    args.add_argument(
+        "--connect_timeout",
+        type=float,
+        default=None,
+        help="Seconds to wait when making a connection",
+    )
+    args.add_argument(
+        "--read_timeout",
+        type=float,
+        default=None,
+        help="Seconds to wait when reading a reply",
+    )
+    args.add_argument(
+        "--no_tcp_keepalive",
+        action="store_true",
+        default=False,
+        help="Do not use TCP keepalive on connections",
+    )
+    args.add_argument(
+        "--retry_mode",
+        choices=[
+            "legacy",
+            "standard",
+            "adaptive",
+        ],
+        default=None,
+        help="The botocore retry mode",
+    )
+    args.add_argument(
+        "--max_attempts",
+        type=int,
+        default=None,
+        help="Maximum attempts for each request, including retries",
+    )
     args.add_argument(
         "-v", "--verbose",
         action='count',
@@ -327,15 +777,63 @@ def argparser():
 
     args.add_argument(
         "--mode",
+        action="append",
+        type=mode_spec,
+        default=[],
+        help="What to do with the data, as mode[=target].  Can be repeated"
+        " to send the same data to several outputs.  Modes are: "
+        + ", ".join(output_modes) + " (default is vd)",
+    )
+    args.add_argument(
+        "--flatten",
+        action="store_true",
+        default=False,
+        help="In csv output, flatten nested values into dotted columns and"
+        " tags into Tags.Name style columns",
+    )
+    args.add_argument(
+        "--schema_file",
+        default=None,
+        help="Registry of known csv fields per datatype, used to write csv"
+        " in a single pass and updated with any new fields seen",
+    )
+    args.add_argument(
+        "--stream",
+        action="store_true",
+        default=False,
+        help="Output the data for each region as soon as it is fetched,"
+        " instead of fetching everything first",
+    )
+    args.add_argument(
+        "--shard_threshold",
+        type=int,
+        default=0,
+        help="In files mode, shard into hash-prefix subdirs any directory"
+        " with more than this many resources (default is never)",
+    )
+    args.add_argument(
+        "--pack_file",
+        default="snapshot.pack",
+        help="In pack mode, the default filename to write",
+    )
+    args.add_argument(
+        "--git_dir",
+        default=".",
+        help="In git mode, the default git repository to commit into",
+    )
+    args.add_argument(
+        "--git_branch",
+        default="snapshot",
+        help="In git mode, the branch to commit the snapshot onto",
+    )
+    args.add_argument(
+        "--compress",
         choices=[
-            "csv",
-            "files",
-            "json",
-            "vd",
-            "yaml",
+            "gzip",
+            "zstd",
         ],
-        default="vd",
-        help="What to do with the data",
+        default=None,
+        help="Compress the files, json or pack output",
     )
     args.add_argument(
         "--mode_vd",
@@ -344,7 +842,7 @@ def argparser():
             "json",
         ],
         default="json",
-        help="What data type to send to vd",
+        help="What data type to send to vd, if not given as vd=TYPE",
     )
 
     argparser_subc(args, subc_list)
@@ -358,6 +856,9 @@ def argparser():
     if r.quiet:
         r.verbose = 0
 
+    if not r.mode:
+        r.mode = [("vd", None)]
+
     profiles = []
     for profile in r.profile:
         profiles += profile.split(",")
@@ -368,9 +869,67 @@ def argparser():
         regions += region.split(",")
     r.region = regions
 
+    fields = []
+    for field in r.fields:
+        fields += field.split(",")
+    r.fields = fields
+
     return r
 
 
+def transport_concurrency(args):
+    """Return the most calls that the options could make at once through
+    one client, which is what its connection pool needs to allow for.
+
+    Each fetch_session() creates its own client, so handlers running at
+    once (with --dag_workers or --processes) do not share a pool, and only
+    the concurrency within one handler counts"""
+    concurrency = 1
+
+    if args.shard_zones:
+        concurrency *= aws.ec2.ZONE_WORKERS
+
+    # A page being prefetched while the handler calls something else
+    if args.prefetch_pages:
+        concurrency *= 2
+
+    # A call that misses its deadline is left running while it is tried
+    # again, and each try might be hedged with a duplicate
+    calls = 1
+    if args.deadline is not None:
+        calls = max(1, args.deadline_attempts)
+    if args.hedge_percentile is not None:
+        calls *= 2
+
+    return concurrency * calls
+
+
+def setup_transport(args, concurrency=1):
+    """Configure the client transport from the file and command line"""
+    settings = {}
+    services = {}
+    if args.transport_file:
+        with open(args.transport_file) as f:
+            settings = yaml.safe_load(f) or {}
+        services = settings.pop("services", {})
+
+    # The command line overrides the file
+    for name in [
+            "max_pool_connections",
+            "connect_timeout",
+            "read_timeout",
+            "retry_mode",
+            "max_attempts",
+    ]:
+        value = getattr(args, name)
+        if value is not None:
+            settings[name] = value
+    if args.no_tcp_keepalive:
+        settings["tcp_keepalive"] = False
+
+    aws.setup_transport(settings, services, concurrency)
+
+
 def main():
     argparser_populate_subc("autoscaling", aws.autoscaling)
     argparser_populate_subc("ec2", aws.ec2)
@@ -383,6 +942,13 @@ def main():
     argparser_populate_subc("ssm", aws.ssm)
     args = argparser()
 
+    if args.worker:
+        if args.authkey is None:
+            print("Need --authkey")
+            return
+        aws.run_worker(aws.parse_address(args.worker), args.authkey.encode())
+        return
+
     if not args.command:
         print("Need command")
         return
@@ -393,10 +959,72 @@ def main():
     handler = args.handler()
     handler.verbose = args.verbose
 
-    sessions = aws.setup_sessions(args.verbose, args.profile, args.region)
+    setup_transport(args, transport_concurrency(args))
+    aws.setup_negative_cache(args.negative_ttl)
+    aws.setup_prefetch(args.prefetch_pages)
+    aws.setup_fast_parse(args.fast_json)
+    aws.setup_deadlines(
+        args.deadline,
+        args.deadline_attempts,
+        args.hedge_percentile,
+        args.handler_budget,
+    )
+
+    if args.organization:
+        profile = None
+        if args.profile:
+            profile = args.profile[0]
+        sessions = aws.setup_org_sessions(
+            args.verbose,
+            profile,
+            args.organization_role,
+            args.region,
+        )
+    else:
+        sessions = aws.setup_sessions(
+            args.verbose,
+            args.profile,
+            args.region,
+            dedupe=args.dedupe_accounts,
+        )
+
+    this_journal = None
+    if args.journal or args.resume:
+        # The same command, with the same options, can resume the journal
+        params = {}
+        for param in getattr(args.handler, "params", []):
+            name = param.lstrip("-").replace("-", "_")
+            params[name] = getattr(args, name)
+
+        header = {
+            "handler":
+                f"{args.handler.__module__}.{args.handler.__qualname__}",
+            "params": params,
+            "profile": args.profile,
+            "region": args.region,
+            "organization": args.organization,
+            "organization_role": args.organization_role,
+            "dedupe_accounts": args.dedupe_accounts,
+            "where": args.where,
+            "fields": sorted(args.fields),
+        }
+        this_journal = journal.Journal(header, args.journal, args.resume)
+    aws.setup_journal(this_journal)
 
     process_data(args, handler, sessions)
 
+    if this_journal is not None:
+        # Everything was written, so there is nothing left to resume
+        this_journal.finish()
+
+    avoided = aws.negative_avoided()
+    if avoided and args.verbose:
+        print(
+            f"Skipped {avoided} calls known to fail"
+            " (see --negative_ttl)",
+            file=sys.stderr,
+        )
+
 
 if __name__ == "__main__":
     main()